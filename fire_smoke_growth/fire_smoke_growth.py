@@ -1,49 +1,67 @@
+import json
+import math
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import pandas as pd
 from building import Building
 
-def generate_smoke_grid(rooms, grid_size, smoke_factor=0.5):
+# 没有安装numba时，step以普通Python函数运行
+from numba_compat import njit
+
+# 物理常量 (模块级常量在numba编译时直接折叠进内核)
+RHO_AIR = 1.2        # 空气密度 (kg/m^3)
+ROOM_HEIGHT = 3.0    # 房间高度 (m)，也是分界面高度的上限
+EPS = 1e-3           # 防止除零的小量
+
+def room_grid_bboxes(rooms, grid_size):
     """
-    根据实际房间几何形状生成烟雾分布
+    计算每个房间在烟雾网格中的索引范围 (x_start, x_end, y_start, y_end, z_start, z_end)。
+    房间几何在模拟中不变，只需计算一次。
     """
-    smoke_grid = np.zeros((grid_size, grid_size, grid_size))
-    
-    for room_name, room in rooms.items():
-        # 根据上层质量生成烟雾浓度
-        concentration = smoke_factor * (room["m_upper"] / (room["m_upper"] + room["m_lower"] + 1e-6))
-        concentration = np.clip(concentration, 0, 1)
-        
-        # 根据房间的实际位置分配烟雾
-        vertices = room["geometry"]
-        x_min = min(v[0] for v in vertices)
-        x_max = max(v[0] for v in vertices)
-        y_min = min(v[1] for v in vertices)
-        y_max = max(v[1] for v in vertices)
+    bboxes = np.empty((len(rooms), 6), dtype=np.int32)
+    for i, (room_name, room) in enumerate(rooms.items()):
+        x_min, x_max, y_min, y_max = room["bbox"]
         
         # 将实际坐标映射到网格坐标
-        x_start = int(x_min * grid_size / 50)
-        x_end = int(x_max * grid_size / 50)
-        y_start = int(y_min * grid_size / 40)
-        y_end = int(y_max * grid_size / 40)
+        bboxes[i, 0] = int(x_min * grid_size / 50)
+        bboxes[i, 1] = int(x_max * grid_size / 50)
+        bboxes[i, 2] = int(y_min * grid_size / 40)
+        bboxes[i, 3] = int(y_max * grid_size / 40)
         
         if "1F" in room_name:
-            z_range = slice(0, grid_size//2)
+            bboxes[i, 4:] = (0, grid_size//2)
         elif "2F" in room_name:
-            z_range = slice(grid_size//2, grid_size)
+            bboxes[i, 4:] = (grid_size//2, grid_size)
         else:  # Stairs
-            z_range = slice(0, grid_size)
-            
-        smoke_grid[x_start:x_end, y_start:y_end, z_range] += concentration
+            bboxes[i, 4:] = (0, grid_size)
+    return bboxes
+
+@njit('void(float64[:, :, :], int32[:, :], float64[:])', cache=True)
+def _fill_smoke_grid(smoke_grid, bboxes, concentrations):
+    """把每个房间的烟雾浓度累加到其索引范围内"""
+    for r in range(bboxes.shape[0]):
+        smoke_grid[bboxes[r, 0]:bboxes[r, 1], bboxes[r, 2]:bboxes[r, 3], bboxes[r, 4]:bboxes[r, 5]] += concentrations[r]
+
+def generate_smoke_grid(bboxes, state, grid_size, smoke_factor=0.5):
+    """
+    根据实际房间几何形状生成烟雾分布，bboxes由room_grid_bboxes预先计算
+    """
+    smoke_grid = np.zeros((grid_size, grid_size, grid_size))
+    
+    # 根据上层质量生成烟雾浓度
+    m_upper = state["m_upper"]
+    concentrations = np.clip(smoke_factor * (m_upper / (m_upper + state["m_lower"] + 1e-6)), 0, 1)
+    _fill_smoke_grid(smoke_grid, bboxes, concentrations)
     
     return np.clip(smoke_grid, 0, 1)
 
-def visualize_smoke(smoke_grid, rooms, t, fig=None, axes=None):
+def visualize_smoke(smoke_grid, rooms, state, t, fig=None, axes=None):
     """
     使用 Matplotlib 的体积渲染显示三维烟雾分布。
     - smoke_grid: 三维烟雾浓度网格
     - rooms: 房间数据
+    - state: 房间状态数组
     - t: 当前时间步
     - fig: 图形对象
     - axes: 子图对象列表
@@ -58,62 +76,76 @@ def visualize_smoke(smoke_grid, rooms, t, fig=None, axes=None):
             fig.add_subplot(235),                   # 下层质量
             fig.add_subplot(236)                    # 其他参数
         ]
+        _create_history_lines(axes, rooms)
+        plt.tight_layout()  # 布局只在创建时计算一次
         plt.ion()  # 开启交互模式
     
-    # 清除之前的图形
-    for ax in axes:
-        ax.clear()
-    
     # 1. 烟雾分布图
-    x, y, z = np.indices(smoke_grid.shape)
-    colors = np.empty(smoke_grid.shape + (4,), dtype=float)
-    colors[..., 0] = smoke_grid  # 红色分量
-    colors[..., 1] = smoke_grid * 0.5  # 绿色分量
-    colors[..., 2] = smoke_grid * 0.5  # 蓝色分量
-    colors[..., 3] = smoke_grid * 0.8  # 透明度
+    # 有烟的体素集合每帧都会变化，只能重建；这里只移除上一帧的体素，不清空整个子图
+    for collection in list(axes[0].collections):
+        collection.remove()
+    # RGBA: 红、绿、蓝分量和透明度
+    colors = np.stack([smoke_grid, smoke_grid * 0.5, smoke_grid * 0.5, smoke_grid * 0.8], axis=-1)
     
     axes[0].voxels(smoke_grid, facecolors=colors, edgecolor=None)
     axes[0].set_title(f"Smoke Distribution (t={t}s)")
     
+    # 2.~5. 把本帧数值追加到已有曲线上 (顺序与_create_history_lines一致)
+    _append_points(axes[1], np.column_stack([state["T_upper"], state["T_lower"]]).ravel(), t)
+    _append_points(axes[2], state["h_interface"], t)
+    _append_points(axes[3], state["m_upper"], t)
+    _append_points(axes[4], state["m_lower"], t)
+    
+    plt.draw()
+    plt.pause(0.01)  # 短暂暂停以更新显示
+    
+    return fig, axes
+
+def _create_history_lines(axes, rooms):
+    """
+    为子图2~5的每个房间创建一条持久曲线，并设置标题、坐标轴和图例 (只在创建图形时调用一次)
+    """
     # 2. 温度变化图
-    for room_name, room in rooms.items():
-        axes[1].plot([room["T_upper"]], [t], 'ro', label=f"{room_name}_upper")
-        axes[1].plot([room["T_lower"]], [t], 'bo', label=f"{room_name}_lower")
+    for room_name in rooms:
+        axes[1].plot([], [], 'ro', label=f"{room_name}_upper")
+        axes[1].plot([], [], 'bo', label=f"{room_name}_lower")
     axes[1].set_title("Temperature")
     axes[1].set_xlabel("Temperature (K)")
     axes[1].set_ylabel("Time (s)")
     
     # 3. 分界面高度图
-    for room_name, room in rooms.items():
-        axes[2].plot([room["h_interface"]], [t], 'go', label=room_name)
+    for room_name in rooms:
+        axes[2].plot([], [], 'go', label=room_name)
     axes[2].set_title("Interface Height")
     axes[2].set_xlabel("Height (m)")
     axes[2].set_ylabel("Time (s)")
     
     # 4. 上层质量图
-    for room_name, room in rooms.items():
-        axes[3].plot([room["m_upper"]], [t], 'mo', label=room_name)
+    for room_name in rooms:
+        axes[3].plot([], [], 'mo', label=room_name)
     axes[3].set_title("Upper Layer Mass")
     axes[3].set_xlabel("Mass (kg)")
     axes[3].set_ylabel("Time (s)")
     
     # 5. 下层质量图
-    for room_name, room in rooms.items():
-        axes[4].plot([room["m_lower"]], [t], 'ko', label=room_name)
+    for room_name in rooms:
+        axes[4].plot([], [], 'ko', label=room_name)
     axes[4].set_title("Lower Layer Mass")
     axes[4].set_xlabel("Mass (kg)")
     axes[4].set_ylabel("Time (s)")
     
-    # 添加图例（仅在开始时添加一次）
-    if t == 0:
-        for ax in axes[1:]:
-            ax.legend()
-    
-    plt.tight_layout()
-    plt.draw()
-    plt.pause(0.01)  # 短暂暂停以更新显示
-    
-    return fig, axes
+    # 添加图例
+    for ax in axes[1:5]:
+        ax.legend()
+
+def _append_points(ax, values, t):
+    """
+    把values依次追加到ax中各条曲线的末尾 (x为数值，y为时间)，并更新坐标范围
+    """
+    for line, value in zip(ax.lines, values):
+        line.set_data(np.append(line.get_xdata(), value), np.append(line.get_ydata(), t))
+    ax.relim()
+    ax.autoscale_view()
 
 def initialize_scene():
     """
@@ -129,14 +161,10 @@ def initialize_scene():
     # 一楼房间
     for i, room in enumerate(building.floors[1].rooms):
         room_name = f"1F_Room{i+1}"
-        area = calculate_room_area(room)  # 计算房间面积
         rooms[room_name] = {
             "name": room_name,
-            "T_upper": 300,
-            "T_lower": 293,
-            "m_upper": 0,
-            "m_lower": 1.2 * area * 3,  # 使用实际房间面积
-            "h_interface": 3,
+            "area": calculate_room_area(room),  # 计算房间面积
+            "bbox": calculate_room_bbox(room),  # 包围盒 (x_min, x_max, y_min, y_max)
             "geometry": room,  # 保存房间几何信息
             "connected_rooms": []  # 相邻房间列表
         }
@@ -144,27 +172,19 @@ def initialize_scene():
     # 二楼房间
     for i, room in enumerate(building.floors[2].rooms):
         room_name = f"2F_Room{i+1}"
-        area = calculate_room_area(room)
         rooms[room_name] = {
             "name": room_name,
-            "T_upper": 300,
-            "T_lower": 293,
-            "m_upper": 0,
-            "m_lower": 1.2 * area * 3,
-            "h_interface": 3,
+            "area": calculate_room_area(room),
+            "bbox": calculate_room_bbox(room),
             "geometry": room,
             "connected_rooms": []
         }
     
     # 楼梯
-    stair_area = calculate_room_area(building.staircase["area"])
     rooms["Stairs"] = {
         "name": "Stairs",
-        "T_upper": 300,
-        "T_lower": 293,
-        "m_upper": 0,
-        "m_lower": 1.2 * stair_area * 3,
-        "h_interface": 3,
+        "area": calculate_room_area(building.staircase["area"]),
+        "bbox": calculate_room_bbox(building.staircase["area"]),
         "geometry": building.staircase["area"],
         "connected_rooms": []
     }
@@ -173,21 +193,54 @@ def initialize_scene():
     # 根据门的位置确定相邻房间
     setup_room_connections(rooms, building)
     
+    # 房间的动态状态单独存放在数组中
+    state = create_room_state(rooms)
+    
     # 初始火源设置在1F_Room1
     fire_source = {"room": "1F_Room1", "HRR": 50000}
     
-    return rooms, fire_source
+    return rooms, state, fire_source
+
+def create_room_state(rooms):
+    """
+    以结构数组(SoA)形式创建房间状态：每个字段是长度为房间数的数组，顺序与rooms一致
+    """
+    n_rooms = len(rooms)
+    areas = np.array([room["area"] for room in rooms.values()])
+    return {
+        "T_upper": np.full(n_rooms, 300.0),
+        "T_lower": np.full(n_rooms, 293.0),
+        "m_upper": np.zeros(n_rooms),
+        "m_lower": RHO_AIR * areas * ROOM_HEIGHT,  # 使用实际房间面积
+        "h_interface": np.full(n_rooms, ROOM_HEIGHT),
+    }
 
 def calculate_room_area(vertices):
     """
     计算多边形房间的面积
     """
-    area = 0
-    for i in range(len(vertices)-1):
-        x1, y1 = vertices[i]
-        x2, y2 = vertices[i+1]
-        area += x1*y2 - x2*y1
-    return abs(area) / 2
+    return shoelace(np.ascontiguousarray(vertices, dtype=np.float64))
+
+def calculate_room_bbox(vertices):
+    """
+    计算多边形房间的包围盒 (x_min, x_max, y_min, y_max)
+    """
+    vertices = np.asarray(vertices)
+    x_min, y_min = vertices.min(axis=0)
+    x_max, y_max = vertices.max(axis=0)
+    return x_min, x_max, y_min, y_max
+
+@njit('float64(float64[:, :])', cache=True)
+def shoelace(pts):
+    """
+    鞋带公式计算多边形面积，pts为(N, 2)数组；首尾顶点是否重复均可
+    """
+    s = 0.0
+    n = pts.shape[0]
+    for i in range(n):
+        j = (i + 1) % n
+        s += pts[i, 0] * pts[j, 1] - pts[j, 0] * pts[i, 1]
+    return 0.5 * abs(s)
 
 def setup_room_connections(rooms, building):
     """
@@ -214,120 +267,178 @@ def setup_room_connections(rooms, building):
     rooms["1F_Room1"]["connected_rooms"].append("Stairs")
     rooms["2F_Room1"]["connected_rooms"].append("Stairs")
 
-def update_room_state(room, fire, dt, c_p, A_floor, C_d, vent_area):
+def room_connection_edges(rooms, pairs=None):
     """
-    更新单个房间的状态（质量守恒、能量守恒、分界面高度）。
+    构建房间间传递的连接数组 (src, dst)，只需在模拟开始前计算一次。
+    - pairs为None时使用connected_rooms中的所有连接；connected_rooms是双向记录的，
+      每对相邻房间只保留一次 (src < dst)，避免重复传递
+    - pairs为 [(起点房间名, 终点房间名), ...] 时只使用这些连接，且必须是相邻房间
     """
-    # 参数验证
-    if room["T_upper"] < room["T_lower"]:
-        raise ValueError(f"Upper layer temperature cannot be lower than lower layer: {room['name']}")
-
-    # 火灾产生的烟气质量和热量
-    if fire["room"] == room["name"]:
-        Q_fire = fire["HRR"]
-        m_fire = Q_fire / (c_p * (room["T_upper"] - room["T_lower"] + 1e-3))
+    room_index = {name: i for i, name in enumerate(rooms)}
+    if pairs is None:
+        edges = sorted({
+            (room_index[name], room_index[other])
+            for name, room in rooms.items()
+            for other in room["connected_rooms"]
+            if room_index[name] < room_index[other]
+        })
     else:
-        Q_fire = 0
-        m_fire = 0
+        edges = []
+        for room_from, room_to in pairs:
+            if room_to not in rooms[room_from]["connected_rooms"]:
+                raise ValueError(f"Rooms are not connected: {room_from}, {room_to}")
+            edges.append((room_index[room_from], room_index[room_to]))
+    edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
 
-    # 通风口的流量
-    vent_flow = max(0, C_d * vent_area * ((room["T_upper"] - room["T_lower"]) / 1.2) ** 0.5)
+# 显式签名：导入时即编译(或从缓存加载)，nogil使计算期间释放GIL
+@njit('int64(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], float64[:], '
+      'float64, float64, float64, float64)', cache=True, nogil=True, fastmath=True)
+def step(T_upper, T_lower, m_upper, m_lower, h_interface, A_floor, HRR,
+         dt, c_p, C_d, vent_area):
+    """
+    更新所有房间一个时间步的状态（质量守恒、能量守恒、分界面高度）。
+    状态数组原地更新；若某房间上层温度低于下层，停止并返回该房间的索引，否则返回-1。
+    """
+    for i in range(T_upper.shape[0]):
+        # 参数验证
+        if T_upper[i] < T_lower[i]:
+            return i
 
-    # 质量守恒
-    room["m_upper"] = max(0, room["m_upper"] + (m_fire - vent_flow) * dt)
-    room["m_lower"] = max(0, room["m_lower"] - (m_fire - vent_flow) * dt)
+        # 火灾产生的烟气质量和热量 (无火源时HRR为0，结果自然为0，无需分支)
+        Q_fire = HRR[i]
+        m_fire = Q_fire / (c_p * (T_upper[i] - T_lower[i] + EPS))
 
-    # 能量守恒
-    if room["m_upper"] > 0:
-        room["T_upper"] += (Q_fire - c_p * vent_flow * (room["T_upper"] - room["T_lower"])) / (room["m_upper"] * c_p + 1e-3) * dt
-    if room["m_lower"] > 0:
-        room["T_lower"] -= (Q_fire - c_p * vent_flow * (room["T_upper"] - room["T_lower"])) / (room["m_lower"] * c_p + 1e-3) * dt
+        # 通风口的流量
+        vent_flow = max(0.0, C_d * vent_area * math.sqrt((T_upper[i] - T_lower[i]) / RHO_AIR))
 
-    # 分界面高度
-    room["h_interface"] = max(0, min(room["m_lower"] / (1.2 * A_floor), 3))
+        # 质量守恒
+        net_mass = (m_fire - vent_flow) * dt
+        m_upper[i] = max(0.0, m_upper[i] + net_mass)
+        m_lower[i] = max(0.0, m_lower[i] - net_mass)
 
-    return room
+        # 能量守恒
+        if m_upper[i] > 0:
+            T_upper[i] += (Q_fire - c_p * vent_flow * (T_upper[i] - T_lower[i])) / (m_upper[i] * c_p + EPS) * dt
+        if m_lower[i] > 0:
+            T_lower[i] -= (Q_fire - c_p * vent_flow * (T_upper[i] - T_lower[i])) / (m_lower[i] * c_p + EPS) * dt
 
-def transfer_between_rooms(room_from, room_to, transfer_coeff, dt):
+        # 分界面高度
+        h_interface[i] = max(0.0, min(m_lower[i] / (RHO_AIR * A_floor[i]), ROOM_HEIGHT))
+    return -1
+
+def create_fire_hrr(room_names, fire_sources):
+    """
+    把火源列表转换为每个房间的热释放速率数组 (W)，没有火源的房间为0
+    """
+    HRR = np.zeros(len(room_names))
+    for fire in fire_sources:
+        HRR[room_names.index(fire["room"])] += fire["HRR"]
+    return HRR
+
+def update_room_states(state, room_names, A_floor, HRR, dt, c_p, C_d, vent_area):
+    """
+    更新所有房间的状态，数值计算由step完成。
+    """
+    bad = step(state["T_upper"], state["T_lower"], state["m_upper"], state["m_lower"],
+               state["h_interface"], A_floor, HRR, dt, c_p, C_d, vent_area)
+    if bad >= 0:
+        raise ValueError(f"Upper layer temperature cannot be lower than lower layer: {room_names[bad]}")
+
+def transfer_between_rooms(state, src, dst, transfer_coeff, dt):
     """
     模拟不同房间之间的烟气和热量传递。
+    src、dst为各连接两端房间在状态数组中的索引数组，所有连接一次性向量化计算。
     """
+    T_upper = state["T_upper"]
+    m_upper = state["m_upper"]
+    
     # 计算上层温度差和流量
-    delta_T = room_from["T_upper"] - room_to["T_upper"]
+    delta_T = T_upper[src] - T_upper[dst]
     transfer_mass = transfer_coeff * delta_T * dt  # 质量流动量
 
-    # 更新质量
-    room_from["m_upper"] -= transfer_mass
-    room_to["m_upper"] += transfer_mass
+    # 更新质量 (同一房间可能出现在多个连接中，用ufunc.at累加)
+    np.subtract.at(m_upper, src, transfer_mass)
+    np.add.at(m_upper, dst, transfer_mass)
 
     # 更新能量
-    energy_transfer = transfer_mass * (room_from["T_upper"] - room_to["T_upper"])
-    room_from["T_upper"] -= energy_transfer / (room_from["m_upper"] + 1e-3)
-    room_to["T_upper"] += energy_transfer / (room_to["m_upper"] + 1e-3)
-
-    return room_from, room_to
-
-def export_results(results, filename):
-    """
-    导出模拟结果到CSV文件
-    """
-    data = []
-    for room_name, room_data in results.items():
-        for t in range(len(room_data["h_interface"])):
-            data.append({
-                "time": t,
-                "room": room_name,
-                "h_interface": room_data["h_interface"][t],
-                "T_upper": room_data["T_upper"][t],
-                "T_lower": room_data["T_lower"][t]
-            })
+    energy_transfer = transfer_mass * delta_T
+    dT_from = energy_transfer / (m_upper[src] + EPS)
+    dT_to = energy_transfer / (m_upper[dst] + EPS)
+    np.subtract.at(T_upper, src, dT_from)
+    np.add.at(T_upper, dst, dT_to)
+
+def export_results(results, room_names, filename):
+    """
+    导出模拟结果到CSV文件。results中每个字段为 (房间数, 时间步数) 的数组。
+    room列为房间编号，编号与房间名的对应关系另存为同名的 *_rooms.json 文件
+    """
+    n_rooms, n_steps = results["h_interface"].shape
+    data = np.column_stack([
+        np.tile(np.arange(n_steps), n_rooms),
+        np.repeat(np.arange(n_rooms), n_steps),
+        results["h_interface"].ravel(),
+        results["T_upper"].ravel(),
+        results["T_lower"].ravel(),
+    ])
+    np.savetxt(filename, data, delimiter=",", header="time,room,h_interface,T_upper,T_lower",
+               comments="", fmt=["%d", "%d", "%.6g", "%.6g", "%.6g"])
     
-    df = pd.DataFrame(data)
-    df.to_csv(filename, index=False)
+    with open(os.path.splitext(filename)[0] + "_rooms.json", "w", encoding="utf-8") as f:
+        json.dump(dict(enumerate(room_names)), f, ensure_ascii=False, indent=2)
 
 # 模型参数
 c_p = 1000  # 空气比热 (J/kg.K)
 vent_area = 1.0  # 通风口面积 (m^2)
 C_d = 0.6  # 排气系数
 transfer_coeff = 0.01  # 房间间传递系数
+# 参与房间间传递的相邻房间对，为None时对所有相邻房间传递。
+# 目前的传递公式在上层质量接近0的房间(如楼梯)会造成温度倒挂，因此仍只启用这一对
+transfer_pairs = [("1F_Room1", "1F_Room2")]
 dt = 1  # 时间步长 (s)
 time = np.arange(0, 300, dt)  # 模拟5分钟
 grid_size = 10  # 每个房间划分的网格大小
+render_every = 10  # 每隔多少秒绘制一次 (三维体素渲染开销远大于数值计算)
 
 # 初始化场景
-rooms, fire_source = initialize_scene()
+rooms, state, fire_source = initialize_scene()
+room_names = list(rooms)
+A_floor = np.full(len(rooms), 50.0)  # 计算分界面高度使用的地面面积 (m^2)
+HRR = create_fire_hrr(room_names, [fire_source])
+
+# 参与房间间传递的连接 (起点房间, 终点房间)
+transfer_src, transfer_dst = room_connection_edges(rooms, transfer_pairs)
+
+# 各房间在烟雾网格中的索引范围
+smoke_bboxes = room_grid_bboxes(rooms, grid_size)
 
-# 存储结果
-results = {room: {"h_interface": [], "T_upper": [], "T_lower": []} for room in rooms}
+# 存储结果 (房间数, 时间步数)，按时间步写入对应的列
+results = {key: np.empty((len(rooms), len(time))) for key in ("h_interface", "T_upper", "T_lower")}
 
 # 初始化图形对象
 fig = None
 axes = None
 
 # 仿真循环
-for t in time:
+for t_idx, t in enumerate(time):
     # 更新单个房间状态
-    for room_name, room in rooms.items():
-        rooms[room_name] = update_room_state(room, fire_source, dt, c_p, 50, C_d, vent_area)
+    update_room_states(state, room_names, A_floor, HRR, dt, c_p, C_d, vent_area)
 
     # 模拟房间间传递
-    rooms["1F_Room1"], rooms["1F_Room2"] = transfer_between_rooms(
-        rooms["1F_Room1"], rooms["1F_Room2"], transfer_coeff, dt
-    )
+    transfer_between_rooms(state, transfer_src, transfer_dst, transfer_coeff, dt)
 
     # 保存结果
-    for room_name, room in rooms.items():
-        results[room_name]["h_interface"].append(room["h_interface"])
-        results[room_name]["T_upper"].append(room["T_upper"])
-        results[room_name]["T_lower"].append(room["T_lower"])
+    for key, column in results.items():
+        column[:, t_idx] = state[key]
     
     # 生成三维网格并可视化
-    smoke_grid = generate_smoke_grid(rooms, grid_size)
-    fig, axes = visualize_smoke(smoke_grid, rooms, t, fig, axes)
+    if int(t) % render_every == 0:
+        smoke_grid = generate_smoke_grid(smoke_bboxes, state, grid_size)
+        fig, axes = visualize_smoke(smoke_grid, rooms, state, t, fig, axes)
 
 plt.ioff()  # 关闭交互模式
 plt.show()  # 显示最终结果
 
 # 导出结果
-export_results(results, "results.csv")
+export_results(results, room_names, "results.csv")
 
@@ -1,5 +1,7 @@
 # building.py
 
+import numpy as np
+
 class Floor:
     def __init__(self, floor_number, width, length, capacity):
         self.floor_number = floor_number  # 楼层编号
@@ -7,16 +9,38 @@ class Floor:
         self.length = length              # 楼层长度
         self.capacity = capacity          # 楼层最大容纳人数
         self.current_people = 0           # 当前楼层人数
-        self.main_exit = None            # 主出口位置（仅一楼有）
+        self.main_exit = None            # 主出口位置（仅一楼有），赋值时同步更新main_exit_array
         
         self.rooms = []          # 房间边界
         self.doors = []          # 门的位置
         self.building_exit = []  # 建筑物出口（仅一楼有）
         self.obstacles = []      # 障碍物（圆形或线段）
     
+    @property
+    def main_exit(self):
+        return self._main_exit
+    
+    @main_exit.setter
+    def main_exit(self, position):
+        self._main_exit = position
+        # 主出口位置的ndarray形式，供模拟直接使用
+        self.main_exit_array = None if position is None else np.array(position, dtype=float)
+    
     def set_main_exit(self, x, y):
         """设置主出口位置"""
         self.main_exit = (x, y)
+    
+    # ndarray形式在每次访问时由当前的rooms/doors生成 (不缓存)，原地修改列表后也不会过期；
+    # 只在初始化Agent和绘制静态背景时使用，开销可以忽略
+    @property
+    def room_arrays(self):
+        """房间边界的ndarray形式，每个形状为(N, 2)"""
+        return [np.array(room, dtype=float) for room in self.rooms]
+    
+    @property
+    def door_arrays(self):
+        """门的ndarray形式，每个形状为(2, 2)"""
+        return [np.array(door, dtype=float) for door in self.doors]
 
 class Stairs:
     def __init__(self, connecting_floors, capacity):
@@ -33,7 +57,7 @@ class Stairs:
         
         # 楼梯的几何信息
         self.area = None                  # 楼梯区域多边形
-        self.entries = {}                 # 各楼层入口位置 {floor_num: position}
+        self.entries = {}                 # 各楼层入口位置 {floor_num: position}，赋值时同步更新entry_arrays
         self.queue = []                   # 等待队列
     
     def initialize_geometry(self, area, entries):
@@ -41,6 +65,16 @@ class Stairs:
         self.area = area
         self.entries = entries
     
+    @property
+    def entries(self):
+        return self._entries
+    
+    @entries.setter
+    def entries(self, entries):
+        self._entries = entries
+        # 入口位置的ndarray形式 {floor_num: ndarray}
+        self.entry_arrays = {floor: np.array(pos, dtype=float) for floor, pos in entries.items()}
+    
     def get_entry_position(self, floor):
         """获取指定楼层的入口位置"""
         return self.entries.get(floor)
@@ -49,6 +83,10 @@ class Stairs:
         """获取指定楼层的出口位置"""
         return self.entries.get(floor)
     
+    def get_entry_array(self, floor):
+        """获取指定楼层的入口/出口位置 (缓存的ndarray)"""
+        return self.entry_arrays.get(floor)
+    
     def can_move_between(self, from_floor, to_floor):
         """检查是否可以在两个楼层间移动"""
         return (from_floor in self.connecting_floors and 
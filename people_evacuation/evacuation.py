@@ -1,18 +1,93 @@
 # evacuation.py
 
 import numpy as np
-from pathfinding import Grid, a_star
+from types import SimpleNamespace
+from pathfinding import Grid
+import evacuation_kernels
 
 # 设置检测距离
 DETECT_DISTANCE = 2.0
+ARRIVAL_DISTANCE = 0.5                 # 到达路径点的判定距离
+ESCAPE_DISTANCE = 2.0                  # 到达主出口(逃生)的判定距离
+
+# 距离判定统一与阈值的平方比较，省去开方
+DETECT_DISTANCE_SQ = DETECT_DISTANCE ** 2
+ARRIVAL_DISTANCE_SQ = ARRIVAL_DISTANCE ** 2
+ESCAPE_DISTANCE_SQ = ESCAPE_DISTANCE ** 2
+
+# 空路径
+EMPTY_PATH = np.empty((0, 2))
+
+# 目标类型在状态数组中的编码
+TARGET_TYPE_CODES = {
+    None: evacuation_kernels.TARGET_NONE,
+    'stairs': evacuation_kernels.TARGET_STAIRS,
+    'exit': evacuation_kernels.TARGET_EXIT,
+}
+TARGET_TYPE_NAMES = {code: name for name, code in TARGET_TYPE_CODES.items()}
+
+# 近邻查找时，(dx, dy) 格子偏移
+NEIGHBOR_CELL_OFFSETS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+# Agent状态以结构数组(SoA)的形式保存在EvacuationSimulation中
+# 列名 -> (每行形状, 数据类型)
+# 建筑尺寸不超过几十米，几何量用float32精度足够，内存带宽减半；模拟时间仍用float64
+AGENT_COLUMNS = {
+    'pos': ((2,), np.float32),            # 位置
+    'vel': ((2,), np.float32),            # 速度
+    'target': ((2,), np.float32),         # 当前目标点
+    'has_target': ((), np.bool_),         # 是否有目标点
+    'desired_speed': ((), np.float32),    # 理想速度
+    'radii': ((), np.float32),            # 半径
+    'floor': ((), np.int8),               # 所在楼层
+    'in_stairs': ((), np.bool_),          # 是否在楼梯中
+    'stairs_progress': ((), np.float64),  # 楼梯剩余通行时间
+    'stair_start': ((2,), np.float32),    # 楼梯的起始位置
+    'stair_end': ((2,), np.float32),      # 楼梯的结束位置
+    'evacuated': ((), np.bool_),          # 是否已逃生
+    'target_type': ((), np.int8),         # 目标类型编码 (TARGET_TYPE_CODES)
+    'goal': ((2,), np.float32),           # 当前路径的终点 (楼梯入口或出口)
+    'path_start': ((), np.int64),         # 路径在path_buf中的起始偏移
+    'path_idx': ((), np.int64),           # 下一个路径点在path_buf中的偏移
+    'path_end': ((), np.int64),           # 路径在path_buf中的结束偏移 (不含)
+}
+
+# 路径缓冲区的最小容量 (路径点数)
+MIN_PATH_BUFFER = 1024
+
+class _Column:
+    """把Agent的属性映射到模拟状态数组中的一行"""
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+        return getattr(agent.sim, self.name)[agent.idx]
+
+    def __set__(self, agent, value):
+        getattr(agent.sim, self.name)[agent.idx] = value
 
 class Agent:
-    def __init__(self, x, y, floor):
-        self.position = np.array([x, y])  # 当前位置 (x, y)
-        self.velocity = np.zeros(2)       # 当前速度
+    position = _Column('pos')
+    velocity = _Column('vel')
+    desired_speed = _Column('desired_speed')
+    floor = _Column('floor')
+    radius = _Column('radii')
+    in_stairs = _Column('in_stairs')
+    stairs_progress = _Column('stairs_progress')
+    stair_start_pos = _Column('stair_start')
+    stair_end_pos = _Column('stair_end')
+    evacuated = _Column('evacuated')
+    path_idx = _Column('path_idx')
+
+    def __init__(self, sim, idx, x, y, floor):
+        self.sim = sim                    # 所属模拟 (持有状态数组)
+        self.idx = idx                    # 在状态数组中的行号
+        self.position = (x, y)            # 当前位置 (x, y)
+        self.velocity = 0.0               # 当前速度
         self.desired_speed = 2          # 理想速度 (m/s)
         self.floor = floor                # 当前所在楼层
-        self.path = []                    # 计算好的路径 (由A*算法生成)
         self.target = None                # 当前目标点 (路径中的下一个点)
         self.radius = 0.5                 # Agent的半径 (用于避碰)
         self.evacuated = False            # 是否已经逃生
@@ -20,25 +95,72 @@ class Agent:
         self.target_type = None           # 目标类型：'stairs'（楼梯）或 'exit'（出口）
         self.in_stairs = False            # 是否正在通过楼梯
         self.stairs_progress = 0.0        # 楼梯通行进度 (秒)
-        self.stair_start_pos = None       # 楼梯的起始位置
-        self.stair_end_pos = None         # 楼梯的结束位置
         self.current_stairs = None        # 当前使用的楼梯对象
         self.move_direction = None        # 移动方向：'up' 或 'down'
         self.personal_space = 1.0         # 添加个人空间参数
         self.max_repulsion = 5.0          # 最大排斥力
 
+    @property
+    def target(self):
+        if not self.sim.has_target[self.idx]:
+            return None
+        return self.sim.target[self.idx]
+
+    @target.setter
+    def target(self, value):
+        if value is None:
+            self.sim.has_target[self.idx] = False
+        else:
+            self.sim.target[self.idx] = value
+            self.sim.has_target[self.idx] = True
+
+    @property
+    def target_type(self):
+        return TARGET_TYPE_NAMES[int(self.sim.target_type[self.idx])]
+
+    @target_type.setter
+    def target_type(self, value):
+        self.sim.target_type[self.idx] = TARGET_TYPE_CODES[value]
+
+    @property
+    def path(self):
+        """尚未走过的路径点 (沿流场生成，形状为(N, 2))，是共享路径缓冲区的视图"""
+        sim, i = self.sim, self.idx
+        return sim.path_buf[sim.path_idx[i]:sim.path_end[i]]
+
+    def next_waypoint(self):
+        """把下一个路径点设为目标，路径已走完时返回False"""
+        sim, i = self.sim, self.idx
+        if sim.path_idx[i] >= sim.path_end[i]:
+            return False
+        self.target = sim.path_buf[sim.path_idx[i]]
+        sim.path_idx[i] += 1
+        return True
+
 class EvacuationSimulation:
-    def __init__(self, building):
+    def __init__(self, building, seed=None):
         self.building = building           # 建筑物对象，包含楼层信息
+        self.rng = np.random.default_rng(seed)  # 随机数生成器 (PCG64)
         self.agents = []                   # 所有疏散人员
         self.time = 0                      # 当前时间 (秒)
         self.dt = 0.1                      # 每个时间步的长度 (秒)
         self.grids = {}                    # 每层楼的网格 (用于A*寻路)
         self.evacuated_count = 0           # 已逃生人数
-        self.evacuation_times = []         # 记录每个逃生人员的逃生时间
+        self._evacuation_times = np.empty(0)  # 逃生时间缓冲区，前evacuated_count个有效
+        self._evacuation_time_sum = 0.0    # 逃生时间之和 (增量维护)
+        self._evacuation_time_max = 0.0    # 最大逃生时间 (增量维护)
         self.stairs_capacity = 10          # 楼梯同时容纳的人数 (未实际使用)
         self.stairs_queue = {}             # 每层楼的楼梯队列 (未实际使用)
+        self.active_count = 0              # 状态数组中有效的Agent数量
+        self._flow_goals = {}              # 流场对应的楼梯 {(楼层, 方向): [(楼梯, 入口位置)]}
+        for name, (shape, dtype) in AGENT_COLUMNS.items():
+            setattr(self, name, np.zeros((0,) + shape, dtype=dtype))
+        # 所有Agent的路径首尾相接存放在一个数组中，Agent只记录偏移 (见set_path)
+        self.path_buf = np.zeros((0, 2), dtype=np.float32)
+        self.path_buf_len = 0              # path_buf中已使用的长度
         self._initialize_grids()           # 初始化网格和楼梯队列
+        self._stairs_by_floor = self._index_stairs_by_floor()  # 每层楼连接的楼梯
+        self.build_flow_fields()           # 计算每层楼到出口/楼梯的流场
     
     def _initialize_grids(self):
         """初始化每层楼的网格"""
@@ -65,26 +187,157 @@ class EvacuationSimulation:
             
             self.grids[floor_num] = grid
     
+    def _index_stairs_by_floor(self):
+        """建立 楼层 -> 连接该楼层的楼梯列表 的索引 (建筑拓扑不变，只需建立一次)"""
+        stairs_by_floor = {floor_num: [] for floor_num in self.building.floors}
+        for stairs_key, stairs in self.building.stairs.items():
+            for floor_num in stairs_key:
+                stairs_by_floor.setdefault(floor_num, []).append(stairs)
+        return stairs_by_floor
+
     def initialize_agents(self, floor_populations):
         """初始化各楼层的人员"""
+        self._reserve(self.active_count + sum(floor_populations.values()))
         for floor_num, population in floor_populations.items():
             floor = self.building.floors[floor_num]
-            for _ in range(population):
-                room_idx = np.random.choice(len(floor.rooms))
-                x, y = self._random_position_in_room(floor.rooms[room_idx])
-                self.agents.append(Agent(x, y, floor_num))
-    
-    def _random_position_in_room(self, room):
-        points = np.array(room)
-        min_x, min_y = np.min(points, axis=0)
-        max_x, max_y = np.max(points, axis=0)
-        return (
-            np.random.uniform(min_x + 0.5, max_x - 0.5),
-            np.random.uniform(min_y + 0.5, max_y - 0.5)
-        )
+            if population == 0:
+                continue
+
+            # 每个房间的包围盒 (向内收缩0.5m)，一次性为该楼层所有人员抽样
+            rooms = floor.room_arrays
+            lows = np.array([room.min(axis=0) for room in rooms], dtype=np.float32) + 0.5
+            highs = np.array([room.max(axis=0) for room in rooms], dtype=np.float32) - 0.5
+            room_idx = self.rng.integers(0, len(rooms), size=population)
+            u = self.rng.random((population, 2), dtype=np.float32)
+            positions = lows[room_idx] + u * (highs[room_idx] - lows[room_idx])
+
+            for x, y in positions:
+                self.add_agent(x, y, floor_num)
+
+    def _reserve(self, capacity):
+        """保证状态数组至少能容纳capacity个Agent"""
+        if capacity <= len(self.pos):
+            return
+        capacity = max(capacity, 2 * len(self.pos))
+        n = self.active_count
+        for name, (shape, dtype) in AGENT_COLUMNS.items():
+            column = np.zeros((capacity,) + shape, dtype=dtype)
+            column[:n] = getattr(self, name)[:n]
+            setattr(self, name, column)
+
+    def add_agent(self, x, y, floor):
+        """在状态数组末尾添加一个Agent"""
+        self._reserve(self.active_count + 1)
+        # 复用的行可能残留已移除Agent的状态
+        for name in AGENT_COLUMNS:
+            getattr(self, name)[self.active_count] = 0
+        agent = Agent(self, self.active_count, x, y, floor)
+        self.active_count += 1
+        self.agents.append(agent)
+        return agent
+
+    def _remove_agents(self, indices):
+        """把尾部仍在模拟中的Agent交换到被移除的位置 (O(移除数量)，不压缩整个列表)"""
+        indices = np.asarray(indices, dtype=np.intp)
+        n = self.active_count
+        new_n = n - indices.size
+        for i in indices:
+            self._detach(self.agents[i])
+
+        # 尾部未被移除的Agent依次填入前面的空位
+        tail = np.arange(new_n, n)
+        sources = tail[~np.isin(tail, indices)]
+        holes = indices[indices < new_n]
+        for name in AGENT_COLUMNS:
+            column = getattr(self, name)
+            column[holes] = column[sources]
+        for hole, source in zip(holes, sources):
+            moved = self.agents[source]
+            moved.idx = hole
+            self.agents[hole] = moved
+
+        del self.agents[new_n:]
+        self.active_count = new_n
+
+    def _detach(self, agent):
+        """把Agent的状态复制出来，使其离开模拟后仍可读取"""
+        i = agent.idx
+        state = SimpleNamespace(**{
+            name: getattr(self, name)[i:i + 1].copy() for name in AGENT_COLUMNS
+        })
+        # 路径也复制一份，偏移改为相对于副本
+        start = state.path_start[0]
+        state.path_buf = self.path_buf[start:state.path_end[0]].copy()
+        state.path_start -= start
+        state.path_idx -= start
+        state.path_end -= start
+        agent.sim = state
+        agent.idx = 0
+
+    def set_path(self, agent, path):
+        """把路径复制到共享路径缓冲区末尾，Agent从路径起点开始前进"""
+        length = len(path)
+        self._reserve_path_buffer(length)
+        start = self.path_buf_len
+        self.path_buf[start:start + length] = path
+        self.path_buf_len += length
+        i = agent.idx
+        self.path_start[i] = start
+        self.path_idx[i] = start
+        self.path_end[i] = start + length
+
+    def _reserve_path_buffer(self, extra):
+        """
+        保证路径缓冲区末尾还能追加extra个路径点。空间不足时先压缩：
+        只保留各Agent尚未走过的路径段，必要时再扩容。
+        压缩后path_start与path_idx相同，已走过的路径点不再保留。
+        """
+        if self.path_buf_len + extra <= len(self.path_buf):
+            return
+        n = self.active_count
+        lengths = self.path_end[:n] - self.path_idx[:n]
+        live = int(lengths.sum())
+        capacity = max(len(self.path_buf), MIN_PATH_BUFFER)
+        if live + extra > capacity // 2:
+            capacity = max(2 * (live + extra), 2 * capacity)
+        new_start = np.cumsum(lengths) - lengths
+        # 目标位置k对应原位置 k + (path_idx - new_start)
+        source = np.repeat(self.path_idx[:n] - new_start, lengths) + np.arange(live)
+        path_buf = np.zeros((capacity, 2), dtype=np.float32)
+        path_buf[:live] = self.path_buf[source]
+        self.path_buf = path_buf
+        self.path_buf_len = live
+        self.path_start[:n] = new_start
+        self.path_idx[:n] = new_start
+        self.path_end[:n] = new_start + lengths
     
+    def build_flow_fields(self):
+        """
+        在每层楼的网格上，从目标(一楼为主出口，其余楼层为通往下一层的楼梯入口)出发
+        构建整层共享的流场 (见Grid.build_flow_field)。网格障碍物变化后流场由Grid自动重建。
+        """
+        self._flow_goals.clear()
+        for floor_num, floor in self.building.floors.items():
+            grid = self.grids[floor_num]
+            if floor.main_exit is not None:
+                grid.build_flow_field('exit', [floor.main_exit])
+            if floor_num == 1:
+                continue
+
+            direction = 'down' if floor_num > 1 else 'up'
+            goals = []
+            for stairs in self._stairs_by_floor[floor_num]:
+                if stairs.get_next_floor(floor_num, direction) is None:
+                    continue
+                stair_pos = stairs.get_entry_position(floor_num)
+                if stair_pos is not None:
+                    goals.append((stairs, stair_pos))
+            if goals:
+                grid.build_flow_field(direction, [stair_pos for _, stair_pos in goals])
+                self._flow_goals[(floor_num, direction)] = goals
+
     def find_path(self, agent):
-        floor = self.building.floors[agent.floor]
+        """沿所在楼层共享的流场得到路径，不再为每个Agent单独做A*搜索"""
         grid = self.grids[agent.floor]
         
         # 如果不在一楼且还没有到达出口
@@ -93,248 +346,298 @@ class EvacuationSimulation:
             direction = 'down' if agent.floor > 1 else 'up'
             agent.target_type = 'stairs'
             
-            # 获取连接当前楼层的楼梯
-            for stairs_key, stairs in self.building.stairs.items():
-                if agent.floor in stairs_key:
-                    next_floor = stairs.get_next_floor(agent.floor, direction)
-                    if next_floor is not None:
-                        stair_pos = stairs.get_entry_position(agent.floor)
-                        if stair_pos is None:
-                            continue
-                        
-                        path = a_star(tuple(agent.position), stair_pos, grid)
-                        if path:
-                            agent.path = path
-                            agent.target = np.array(agent.path.pop(0))
-                            agent.current_stairs = stairs
-                            agent.move_direction = direction
-                            return
+            if direction in grid.flow_goals:
+                path = grid.trace_flow_field(direction, agent.position)
+                if len(path):
+                    # 路径终点所在的楼梯入口即为最近的楼梯
+                    end = path[-1]
+                    stairs, stair_pos = min(
+                        self._flow_goals[(agent.floor, direction)],
+                        key=lambda goal: (goal[1][0] - end[0]) ** 2 + (goal[1][1] - end[1]) ** 2)
+                    self.set_path(agent, path)
+                    self.goal[agent.idx] = stair_pos
+                    agent.next_waypoint()
+                    agent.current_stairs = stairs
+                    agent.move_direction = direction
+                    return
             agent.target = None
         else:
-            # 在一楼，寻找到主出口的路径
+            # 在一楼，沿流场前往主出口
             agent.target_type = 'exit'
-            if floor.main_exit is None:
+            if 'exit' not in grid.flow_goals:
                 agent.target = None
                 return
             
-            path = a_star(tuple(agent.position), floor.main_exit, grid)
-            if path:
-                agent.path = path
-                agent.target = np.array(agent.path.pop(0))
+            path = grid.trace_flow_field('exit', agent.position)
+            if len(path):
+                self.set_path(agent, path)
+                self.goal[agent.idx] = self.building.floors[agent.floor].main_exit
+                agent.next_waypoint()
             else:
                 agent.target = None
-    
+
     def update(self):
         """更新一个时间步"""
         self.time += self.dt
-        for agent in self.agents:
-            # 移除条件判断，让所有没有目标的agent都尝试寻路
-            if agent.target is None:
-                self.find_path(agent)
-            
-            self._update_agent_position(agent)
+
+        # 移除条件判断，让所有没有目标的agent都尝试寻路
+        for i in np.flatnonzero(~self.has_target[:self.active_count]):
+            self.find_path(self.agents[i])
+
+        # 楼梯进度、到达判定、路径点推进、避碰和位置积分在一次遍历中完成，
+        # 只有路径走完或到达楼梯入口附近时才返回需要Python处理的事件
+        if evacuation_kernels.HAVE_NUMBA:
+            events = self._step_agents()
+        else:
+            events = self._step_agents_numpy()
+
+        for i in np.flatnonzero(events):
+            agent = self.agents[i]
+            if events[i] == evacuation_kernels.EVENT_STAIRS_DONE:
+                self._finish_stairs(agent)
+            else:
+                self._on_arrival(agent)
         
         self.remove_escaped_agents()
     
-    def _update_agent_position(self, agent):
-        # 如果正在楼梯中
-        if agent.in_stairs:
-            agent.stairs_progress -= self.dt
-            if agent.stairs_progress <= 0:
-                if agent.current_stairs is None:
-                    return
-                
-                # 完成楼梯移动
-                agent.current_stairs.exit(agent)
-                next_floor = agent.current_stairs.get_next_floor(agent.floor, agent.move_direction)
-                if next_floor is None:
-                    return
-                
-                agent.floor = next_floor
-                agent.in_stairs = False
-                agent.path = []
-                agent.target = None
-                agent.target_type = 'exit' if agent.floor == 1 else 'stairs'
-                
-                # 重置agent的位置到楼梯出口
-                exit_pos = agent.current_stairs.get_exit_position(agent.floor)
-                if exit_pos is not None:
-                    agent.position = np.array(exit_pos)
-                    self.find_path(agent)
-                return
-            
+    def _finish_stairs(self, agent):
+        """楼梯通行时间结束，到达下一层"""
+        if agent.current_stairs is None:
             return
-
-        # 没有目标则不移动
-        if agent.target is None:
-            self.find_path(agent)
+        
+        # 完成楼梯移动
+        agent.current_stairs.exit(agent)
+        next_floor = agent.current_stairs.get_next_floor(agent.floor, agent.move_direction)
+        if next_floor is None:
             return
-
-        # 计算到目标点的距离
-        distance = np.linalg.norm(agent.target - agent.position)
         
-        # 简化到达判定
-        if distance < 0.5:  # 降低到达判定距离
-            if agent.target_type == 'stairs' and not agent.in_stairs:
-                # 重新获取当前楼层的楼梯对象
-                for stairs_key, stairs in self.building.stairs.items():
-                    if agent.floor in stairs_key:
-                        stair_pos = stairs.get_entry_position(agent.floor)
-                        if stair_pos is not None:
-                            dist_to_stairs = np.linalg.norm(agent.position - np.array(stair_pos))
-                            if dist_to_stairs < DETECT_DISTANCE:  # 确认确实在楼梯入口
-                                agent.current_stairs = stairs
-                                if stairs.enter(agent):
-                                    agent.in_stairs = True
-                                    agent.stairs_progress = stairs.passing_time
-                                    agent.stair_start_pos = agent.position.copy()
-                                    
-                                    next_floor = stairs.get_next_floor(agent.floor, agent.move_direction)
-                                    if next_floor is not None:
-                                        exit_pos = stairs.get_exit_position(next_floor)
-                                        if exit_pos is not None:
-                                            agent.stair_end_pos = np.array(exit_pos)
-                                            return
-            
-                # 如果还没到达楼梯入口或无法进入楼梯，继续移动
-                if agent.path:
-                    agent.target = np.array(agent.path.pop(0))
-                else:
-                    # 重新寻路到楼梯
-                    self.find_path(agent)
-                return
-            
-            # 如果还有路径点，继续移动
-            if agent.path:
-                agent.target = np.array(agent.path.pop(0))
-            else:
-                agent.target = None
+        agent.floor = next_floor
+        agent.in_stairs = False
+        self.set_path(agent, EMPTY_PATH)
+        agent.target = None
+        agent.target_type = 'exit' if agent.floor == 1 else 'stairs'
+        
+        # 重置agent的位置到楼梯出口
+        exit_pos = agent.current_stairs.get_entry_array(agent.floor)
+        if exit_pos is not None:
+            agent.position = exit_pos
+            self.find_path(agent)
+
+    def _on_arrival(self, agent):
+        """到达当前目标点：进入楼梯或切换到下一个路径点"""
+        if agent.target_type == 'stairs' and not agent.in_stairs:
+            position = agent.position
+            # 重新获取当前楼层的楼梯对象
+            for stairs in self._stairs_by_floor[agent.floor]:
+                stair_pos = stairs.get_entry_array(agent.floor)
+                if stair_pos is not None:
+                    sx = position[0] - stair_pos[0]
+                    sy = position[1] - stair_pos[1]
+                    if sx * sx + sy * sy < DETECT_DISTANCE_SQ:  # 确认确实在楼梯入口
+                        agent.current_stairs = stairs
+                        if stairs.enter(agent):
+                            agent.in_stairs = True
+                            agent.stairs_progress = stairs.passing_time
+                            agent.stair_start_pos = agent.position
+                            
+                            next_floor = stairs.get_next_floor(agent.floor, agent.move_direction)
+                            if next_floor is not None:
+                                exit_pos = stairs.get_entry_array(next_floor)
+                                if exit_pos is not None:
+                                    agent.stair_end_pos = exit_pos
+                                    return
+    
+            # 如果还没到达楼梯入口或无法进入楼梯，继续移动
+            if not agent.next_waypoint():
+                # 重新寻路到楼梯
                 self.find_path(agent)
             return
-
-        # 计算移动方向和速度
-        direction = agent.target - agent.position
-        dist = np.linalg.norm(direction)
-        if dist > 0:
-            desired_velocity = (direction / dist) * agent.desired_speed
-        else:
-            desired_velocity = np.zeros(2)
-        
-        # 避碰
-        actual_velocity = self._avoid_collisions(agent, desired_velocity)
         
-        # 更新位置
-        agent.velocity = actual_velocity
-        agent.position += agent.velocity * self.dt
-
-    # def _avoid_collisions(self, agent, desired_velocity):
-    #     # 当前代理的位置和楼层
-    #     position = agent.position
-    #     floor_agents = [other for other in self.agents if other.floor == agent.floor and other is not agent]
-    #
-    #     if not floor_agents:
-    #         return desired_velocity
-    #
-    #     # 所有其他代理的位置矩阵
-    #     other_positions = np.array([other.position for other in floor_agents])
-    #
-    #     # 计算所有其他代理到当前代理的距离向量和距离
-    #     diff = other_positions - position
-    #     distances = np.linalg.norm(diff, axis=1)
-    #
-    #     # 排斥力计算：距离小于一定范围时产生作用
-    #     min_distances = agent.radius * 2
-    #     mask = distances < min_distances  # 只考虑近距离的代理人
-    #     if not np.any(mask):
-    #         return desired_velocity
-    #
-    #     repulsion_forces = np.zeros_like(diff)
-    #     repulsion_forces[mask] = diff[mask] / (distances[mask][:, None] + 1e-6)
-    #
-    #     # 总排斥力
-    #     total_repulsion = np.sum(repulsion_forces, axis=0) * 0.5
-    #     velocity = desired_velocity - total_repulsion
-    #
-    #     # 限制速度
-    #     speed = np.linalg.norm(velocity)
-    #     if speed > agent.desired_speed:
-    #         velocity = velocity / speed * agent.desired_speed
-    #
-    #     return velocity
-
-    def _avoid_collisions(self, agent, desired_velocity):
-        # 将同楼层所有Agent的位置一次性提取出来
-        # 首先构建一个数组，包含所有与agent楼层相同且不是agent本人的位置
-        positions = []
-        for other in self.agents:
-            if other is not agent and other.floor == agent.floor:
-                positions.append(other.position)
-
-        if len(positions) == 0:
-            # 没有同楼层其他Agent，直接返回desired_velocity
-            return desired_velocity
-
-        positions = np.array(positions)  # shape: (M, 2), M为同楼层其他agent数量
-
-        # 计算位置差值向量
-        diff = positions - agent.position  # shape: (M, 2)
-
-        # 计算距离向量
-        distances = np.sqrt(np.sum(diff ** 2, axis=1))  # shape: (M,)
-
-        min_dist = agent.radius * 2
-
-        # 找出距离小于min_dist的agent索引
-        close_indices = np.where(distances < min_dist)[0]
-        if close_indices.size > 0:
-            # 对close_indices进行斥力计算
-            safe_dist = distances[close_indices] + 1e-6
-            repulsions = diff[close_indices] / safe_dist[:, np.newaxis]  # 每个元素是repulsion向量
-
-            # 汇总所有repulsion
-            total_repulsion = np.sum(repulsions, axis=0) * 0.5
-
-            velocity = desired_velocity - total_repulsion
-        else:
-            velocity = desired_velocity
+        # 如果还有路径点，继续移动
+        if not agent.next_waypoint():
+            agent.target = None
+            self.find_path(agent)
+
+    def _step_agents(self):
+        """使用numba融合内核推进所有Agent一个时间步，返回事件数组"""
+        n = self.active_count
+        new_pos = np.empty_like(self.pos[:n])
+        new_vel = np.empty_like(self.vel[:n])
+        events = np.empty(n, dtype=np.int8)
+        evacuation_kernels.step_agents(
+            self.pos[:n], self.vel[:n], self.target[:n], self.has_target[:n], self.floor[:n],
+            self.radii[:n], self.desired_speed[:n], self.in_stairs[:n], self.stairs_progress[:n],
+            self.path_buf, self.path_idx[:n], self.path_end[:n], self.target_type[:n], self.goal[:n],
+            self.dt, ARRIVAL_DISTANCE_SQ, DETECT_DISTANCE_SQ, new_pos, new_vel, events)
+        self.pos[:n] = new_pos
+        self.vel[:n] = new_vel
+        return events
+
+    def _step_agents_numpy(self):
+        """_step_agents的NumPy实现 (未安装numba时使用)"""
+        n = self.active_count
+        events = np.zeros(n, dtype=np.int8)
+
+        # 楼梯中的Agent只推进通行进度
+        in_stairs = self.in_stairs[:n]
+        progress = self.stairs_progress[:n]
+        progress[in_stairs] -= self.dt
+        events[in_stairs & (progress <= 0)] = evacuation_kernels.EVENT_STAIRS_DONE
+
+        # 到达目标点的Agent本步不移动：还有路径点的直接切换到下一个，
+        # 路径走完或到达楼梯入口附近的交给_on_arrival处理
+        pos = self.pos[:n]
+        walking = ~in_stairs & self.has_target[:n]
+        offset = self.target[:n] - pos
+        arrived = walking & (np.einsum('ij,ij->i', offset, offset) < ARRIVAL_DISTANCE_SQ)
+        to_goal = self.goal[:n] - pos
+        at_stairs = (arrived & (self.target_type[:n] == evacuation_kernels.TARGET_STAIRS)
+                     & (np.einsum('ij,ij->i', to_goal, to_goal) < DETECT_DISTANCE_SQ))
+        advance = np.flatnonzero(arrived & ~at_stairs & (self.path_idx[:n] < self.path_end[:n]))
+        self.target[advance] = self.path_buf[self.path_idx[advance]]
+        self.path_idx[advance] += 1
+        events[arrived] = evacuation_kernels.EVENT_ARRIVED
+        events[advance] = evacuation_kernels.EVENT_NONE
+
+        self._avoid_collisions_batch(walking & ~arrived)
+        return events
+
+    def _neighbor_candidates(self, rows):
+        """
+        用均匀网格(cell list)查找近邻候选。格子边长为最大交互距离(2倍半径)，
+        键由 (楼层, 格子y, 格子x) 编码为整数，排序后用searchsorted取出每个格子的Agent。
+        返回 (ii, jj)：rows[ii] 与 jj 是位于同楼层相邻格子中的Agent对。
+        """
+        n = self.active_count
+        pos = self.pos[:n]
+        cell_size = 2 * self.radii[:n].max()
+        cx = np.floor(pos[:, 0] / cell_size).astype(np.int64)
+        cy = np.floor(pos[:, 1] / cell_size).astype(np.int64)
+        # 四周各留一个空格子，邻域偏移不会跨行或跨楼层
+        cx -= cx.min() - 1
+        cy -= cy.min() - 1
+        nx = cx.max() + 2
+        ny = cy.max() + 2
+        keys = ((self.floor[:n].astype(np.int64) * ny) + cy) * nx + cx
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        row_keys = keys[rows]
+
+        ii_parts = []
+        jj_parts = []
+        for dx, dy in NEIGHBOR_CELL_OFFSETS:
+            neighbor_keys = row_keys + dy * nx + dx
+            lo = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+            counts = np.searchsorted(sorted_keys, neighbor_keys, side='right') - lo
+            total = counts.sum()
+            if total == 0:
+                continue
+            ii = np.repeat(np.arange(rows.size), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            ii_parts.append(ii)
+            jj_parts.append(order[np.repeat(lo, counts) + offsets])
+
+        if not ii_parts:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty
+        return np.concatenate(ii_parts), np.concatenate(jj_parts)
+
+    def _avoid_collisions_batch(self, moving):
+        """一次性计算所有需要移动的Agent的避碰速度并更新位置"""
+        n = self.active_count
+        rows = np.flatnonzero(moving)
+        if rows.size == 0:
+            return
+
+        pos = self.pos[:n]
+
+        # 所有移动Agent的理想速度
+        direction = self.target[rows] - pos[rows]
+        dist = np.sqrt(np.sum(direction ** 2, axis=1))
+        desired_velocity = np.zeros_like(direction)
+        nonzero = dist > 0
+        desired_velocity[nonzero] = (direction[nonzero] / dist[nonzero, np.newaxis]
+                                     * self.desired_speed[rows][nonzero, np.newaxis])
+
+        # 只在3x3邻域格子中查找候选Agent对，O(N*k)而不是O(N^2)
+        ii, jj = self._neighbor_candidates(rows)
+        diff = pos[jj] - pos[rows[ii]]
+        dist_sq = np.einsum('ij,ij->i', diff, diff)
+
+        # 距离小于2倍半径且不是自身 (用距离平方比较，不开方)
+        min_dist = self.radii[rows[ii]] * 2
+        close = (dist_sq < min_dist * min_dist) & (jj != rows[ii])
+        ii, diff, dist_sq = ii[close], diff[close], dist_sq[close]
+
+        # 斥力 diff / |diff|^2：距离越近越大，全程不开方
+        total_repulsion = np.zeros_like(desired_velocity)
+        np.add.at(total_repulsion, ii, diff / (dist_sq[:, np.newaxis] + 1e-6) * 0.5)
+
+        velocity = desired_velocity - total_repulsion
 
         # 限制最大速度
-        speed = np.sqrt(np.sum(velocity ** 2))
-        if speed > agent.desired_speed:
-            velocity = velocity / speed * agent.desired_speed
+        speed = np.sqrt(np.sum(velocity ** 2, axis=1))
+        max_speed = self.desired_speed[rows]
+        too_fast = speed > max_speed
+        velocity[too_fast] *= (max_speed[too_fast] / speed[too_fast])[:, np.newaxis]
 
-        return velocity
+        # 更新位置
+        self.vel[rows] = velocity
+        self.pos[rows] += velocity * self.dt
 
 
     def is_evacuation_complete(self):
-        return len(self.agents) == 0
+        return self.active_count == 0
 
     def remove_escaped_agents(self):
         """简单地检查和移除已经逃生的agents"""
-        escaped = []
-        for agent in self.agents:
-            if agent.floor == 1 and not agent.evacuated:
-                main_exit = self.building.floors[1].main_exit
-                if main_exit is not None:
-                    dist = np.linalg.norm(agent.position - np.array(main_exit))
-                    if dist < 2.0:  # 增大逃生判定距离
-                        agent.evacuated = True
-                        agent.evacuation_time = self.time
-                        self.evacuation_times.append(self.time)
-                        escaped.append(agent)
-                        self.evacuated_count += 1
-        
-        for agent in escaped:
-            self.agents.remove(agent)
-        
-        return len(escaped)
+        main_exit = self.building.floors[1].main_exit_array
+        if main_exit is None:
+            return 0
+
+        # 一次性判断所有在一楼且到达主出口附近的Agent
+        n = self.active_count
+        dx = self.pos[:n, 0] - main_exit[0]
+        dy = self.pos[:n, 1] - main_exit[1]
+        escaped = np.flatnonzero((self.floor[:n] == 1) & ~self.evacuated[:n]
+                                 & (dx * dx + dy * dy < ESCAPE_DISTANCE_SQ))  # 增大逃生判定距离
+
+        if escaped.size:
+            self.evacuated[escaped] = True
+            for i in escaped:
+                self.agents[i].evacuation_time = self.time
+            self._record_evacuations(escaped.size)
+            self._remove_agents(escaped)
+
+        return escaped.size
+
+    def _record_evacuations(self, count):
+        """记录本时间步逃生的count个人，并增量更新统计量"""
+        end = self.evacuated_count + count
+        if end > len(self._evacuation_times):
+            grown = np.empty(max(end, 2 * len(self._evacuation_times)))
+            grown[:self.evacuated_count] = self._evacuation_times[:self.evacuated_count]
+            self._evacuation_times = grown
+        self._evacuation_times[self.evacuated_count:end] = self.time
+        self.evacuated_count = end
+        self._evacuation_time_sum += self.time * count
+        self._evacuation_time_max = max(self._evacuation_time_max, self.time)
+
+    @property
+    def evacuation_times(self):
+        """每个逃生人员的逃生时间 (缓冲区的只读视图，写入会破坏增量维护的统计量)"""
+        times = self._evacuation_times[:self.evacuated_count]
+        times.flags.writeable = False
+        return times
 
     def get_statistics(self):
+        evacuated = self.evacuated_count
         stats = {
             'current_time': self.time,
-            'evacuated_count': self.evacuated_count,
-            'remaining_count': len(self.agents),
-            'average_evacuation_time': np.mean(self.evacuation_times) if self.evacuation_times else 0,
-            'max_evacuation_time': np.max(self.evacuation_times) if self.evacuation_times else 0,
+            'evacuated_count': evacuated,
+            'remaining_count': self.active_count,
+            'average_evacuation_time': self._evacuation_time_sum / evacuated if evacuated else 0,
+            'max_evacuation_time': self._evacuation_time_max if evacuated else 0,
         }
         return stats
\ No newline at end of file
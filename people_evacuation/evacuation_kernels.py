@@ -0,0 +1,204 @@
+# evacuation_kernels.py
+
+import numpy as np
+
+# 没有安装numba时，EvacuationSimulation退回到NumPy批量实现
+from numba_compat import HAVE_NUMBA, njit, prange
+
+
+@njit(cache=True)
+def _build_cells(pos, floor, cell_size):
+    """按 (楼层, 格子x, 格子y) 对Agent做计数排序，返回格子索引表"""
+    n = pos.shape[0]
+    min_x = pos[0, 0]
+    min_y = pos[0, 1]
+    max_x = pos[0, 0]
+    max_y = pos[0, 1]
+    min_f = floor[0]
+    max_f = floor[0]
+    for i in range(1, n):
+        min_x = min(min_x, pos[i, 0])
+        min_y = min(min_y, pos[i, 1])
+        max_x = max(max_x, pos[i, 0])
+        max_y = max(max_y, pos[i, 1])
+        min_f = min(min_f, floor[i])
+        max_f = max(max_f, floor[i])
+
+    nx = int((max_x - min_x) / cell_size) + 1
+    ny = int((max_y - min_y) / cell_size) + 1
+    nf = int(max_f - min_f) + 1
+
+    cell_of = np.empty(n, dtype=np.int64)
+    cell_start = np.zeros(nf * ny * nx + 1, dtype=np.int64)
+    for i in range(n):
+        cx = int((pos[i, 0] - min_x) / cell_size)
+        cy = int((pos[i, 1] - min_y) / cell_size)
+        c = (int(floor[i] - min_f) * ny + cy) * nx + cx
+        cell_of[i] = c
+        cell_start[c + 1] += 1
+    for c in range(nf * ny * nx):
+        cell_start[c + 1] += cell_start[c]
+
+    fill = cell_start[:-1].copy()
+    cell_agents = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        c = cell_of[i]
+        cell_agents[fill[c]] = i
+        fill[c] += 1
+
+    return cell_start, cell_agents, min_x, min_y, min_f, nx, ny
+
+
+# step_agents返回的事件：需要在Python中处理的少数情况
+EVENT_NONE = 0
+EVENT_ARRIVED = 1          # 到达当前目标点
+EVENT_STAIRS_DONE = 2      # 楼梯通行结束
+
+# Agent目标类型编码
+TARGET_NONE = 0
+TARGET_STAIRS = 1          # 前往楼梯入口
+TARGET_EXIT = 2            # 前往主出口
+
+
+# 显式签名：导入时即编译(或从缓存加载)，第一步模拟不再触发编译
+@njit('void(float32[:, :], float32[:, :], float32[:, :], boolean[:], int8[:], float32[:], '
+      'float32[:], boolean[:], float64[:], float32[:, :], int64[:], int64[:], int8[:], float32[:, :], '
+      'float64, float64, float64, float32[:, :], float32[:, :], int8[:])',
+      parallel=True, fastmath=True, cache=True)
+def step_agents(pos, vel, target, has_target, floor, radius, desired_speed,
+                in_stairs, stairs_progress, path_buf, path_idx, path_end, target_type, goal,
+                dt, arrival_sq, detect_sq, out_pos, out_vel, events):
+    """
+    一次遍历完成所有Agent的一个时间步：
+    1. 楼梯中的Agent推进通行进度，结束时标记EVENT_STAIRS_DONE；
+    2. 到达目标点的Agent本步不移动：还有路径点时直接从path_buf取下一个目标，
+       路径走完或已在楼梯入口附近时标记EVENT_ARRIVED；
+    3. 其余有目标的Agent计算理想速度、邻域斥力和限速，并积分出新的位置。
+    斥力只在3x3邻域格子内查找，格子边长为最大交互距离 (2倍半径)；
+    只有最后限速时才需要开方。
+    """
+    n = pos.shape[0]
+    if n == 0:
+        return
+    cell_size = 2.0 * radius.max()
+    cell_start, cell_agents, min_x, min_y, min_f, nx, ny = _build_cells(pos, floor, cell_size)
+
+    for i in prange(n):
+        events[i] = EVENT_NONE
+        out_pos[i, 0] = pos[i, 0]
+        out_pos[i, 1] = pos[i, 1]
+        out_vel[i, 0] = vel[i, 0]
+        out_vel[i, 1] = vel[i, 1]
+
+        if in_stairs[i]:
+            stairs_progress[i] -= dt
+            if stairs_progress[i] <= 0:
+                events[i] = EVENT_STAIRS_DONE
+            continue
+        if not has_target[i]:
+            continue
+
+        # 到达判定
+        dx = target[i, 0] - pos[i, 0]
+        dy = target[i, 1] - pos[i, 1]
+        dist_sq = dx * dx + dy * dy
+        if dist_sq < arrival_sq:
+            gx = goal[i, 0] - pos[i, 0]
+            gy = goal[i, 1] - pos[i, 1]
+            if target_type[i] == TARGET_STAIRS and gx * gx + gy * gy < detect_sq:
+                events[i] = EVENT_ARRIVED
+            elif path_idx[i] < path_end[i]:
+                k = path_idx[i]
+                target[i, 0] = path_buf[k, 0]
+                target[i, 1] = path_buf[k, 1]
+                path_idx[i] = k + 1
+            else:
+                events[i] = EVENT_ARRIVED
+            continue
+
+        # 理想速度
+        dist = np.sqrt(dist_sq)
+        vx = 0.0
+        vy = 0.0
+        if dist > 0:
+            vx = dx / dist * desired_speed[i]
+            vy = dy / dist * desired_speed[i]
+
+        # 邻域斥力：diff / |diff|^2，随距离反比增大，求和过程无需开方
+        rep_x = 0.0
+        rep_y = 0.0
+        min_dist_sq = (radius[i] * 2) ** 2
+        cx = int((pos[i, 0] - min_x) / cell_size)
+        cy = int((pos[i, 1] - min_y) / cell_size)
+        base = int(floor[i] - min_f) * ny
+        for oy in range(max(cy - 1, 0), min(cy + 2, ny)):
+            for ox in range(max(cx - 1, 0), min(cx + 2, nx)):
+                c = (base + oy) * nx + ox
+                for k in range(cell_start[c], cell_start[c + 1]):
+                    j = cell_agents[k]
+                    if j == i:
+                        continue
+                    ex = pos[j, 0] - pos[i, 0]
+                    ey = pos[j, 1] - pos[i, 1]
+                    d_sq = ex * ex + ey * ey
+                    if d_sq < min_dist_sq:
+                        inv = 1.0 / (d_sq + 1e-6)
+                        rep_x += ex * inv
+                        rep_y += ey * inv
+
+        vx -= rep_x * 0.5
+        vy -= rep_y * 0.5
+
+        # 限制最大速度
+        speed = np.sqrt(vx * vx + vy * vy)
+        if speed > desired_speed[i]:
+            vx = vx / speed * desired_speed[i]
+            vy = vy / speed * desired_speed[i]
+
+        out_vel[i, 0] = vx
+        out_vel[i, 1] = vy
+        out_pos[i, 0] = pos[i, 0] + vx * dt
+        out_pos[i, 1] = pos[i, 1] + vy * dt
+
+
+@njit(cache=True)
+def group_agents(floor, in_stairs, target_type, n_groups):
+    """
+    按绘图类别对Agent做计数排序：类别0为楼梯中的Agent，
+    楼层f上前往出口的Agent为2f-1，前往楼梯的为2f。
+    返回 (order, starts)，类别k的Agent行号为 order[starts[k]:starts[k + 1]] (保持原顺序)。
+    """
+    n = floor.shape[0]
+    group = np.empty(n, dtype=np.int64)
+    starts = np.zeros(n_groups + 1, dtype=np.int64)
+    for i in range(n):
+        if in_stairs[i]:
+            g = 0
+        elif target_type[i] == TARGET_STAIRS:
+            g = 2 * floor[i]
+        else:
+            g = 2 * floor[i] - 1
+        group[i] = g
+        starts[g + 1] += 1
+    for g in range(n_groups):
+        starts[g + 1] += starts[g]
+
+    fill = starts[:-1].copy()
+    order = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        g = group[i]
+        order[fill[g]] = i
+        fill[g] += 1
+    return order, starts
+
+
+@njit(cache=True)
+def stair_positions(start, end, progress, rows, passing_time):
+    """楼梯中Agent的显示位置：在楼梯起点和终点之间按已通行的比例插值，passing_time[k]为rows[k]所在楼梯的通行时间"""
+    out = np.empty((rows.shape[0], 2), dtype=np.float32)
+    for k in range(rows.shape[0]):
+        i = rows[k]
+        ratio = 1.0 - progress[i] / passing_time[k]
+        out[k, 0] = start[i, 0] + ratio * (end[i, 0] - start[i, 0])
+        out[k, 1] = start[i, 1] + ratio * (end[i, 1] - start[i, 1])
+    return out
@@ -0,0 +1,15 @@
+# numba_compat.py
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    # 没有安装numba时，@njit修饰的函数以普通Python函数运行，调用方可据HAVE_NUMBA选择NumPy批量实现
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+    prange = range
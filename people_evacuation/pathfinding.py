@@ -1,16 +1,38 @@
 # pathfinding.py
 
+import math
 import numpy as np
-from queue import PriorityQueue
+
+# 没有安装numba时，a_star使用纯Python实现
+from numba_compat import HAVE_NUMBA, njit
+
+# 8邻域方向 (dr, dc)
+DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1))
+SQRT2 = math.sqrt(2.0)
+# 每个方向的步长：直线为1，对角为sqrt(2)
+DIRECTION_COSTS = (1.0, 1.0, 1.0, 1.0, SQRT2, SQRT2, SQRT2, SQRT2)
+# A*使用的整数步长 (放大10倍)：直线10，对角14，f值为整数，可用桶队列代替二叉堆
+STRAIGHT_STEP = 10
+DIAGONAL_STEP = 14
+DIRECTION_STEPS = (STRAIGHT_STEP,) * 4 + (DIAGONAL_STEP,) * 4
 
 class Grid:
     def __init__(self, width: int, length: int, cell_size: float = 0.5):
         self.cell_size = cell_size
         self.cols = int(width / cell_size)
         self.rows = int(length / cell_size)
-        self.grid = np.zeros((self.rows, self.cols), dtype=bool)  # False为可走，True为障碍
+        # 障碍网格外围多留一圈障碍单元 (哨兵)，邻居查找不必检查越界
+        self.padded = np.ones((self.rows + 2, self.cols + 2), dtype=bool)
+        self.padded[1:-1, 1:-1] = False
+        self.grid = self.padded[1:-1, 1:-1]      # 网格内部的视图，False为可走，True为障碍
+        self.flat_grid = self.padded.reshape(-1)  # 带边框网格的一维视图，单元 (r, c) 位于 (r+1)*(cols+2)+(c+1)
         self.doors = []
+        self.flow_goals = {}              # 流场目标 {goal_id: [目标点世界坐标]}
+        self.flow_dist = {}               # 流场距离 {goal_id: (rows, cols) float32，不可达为inf}
+        self.flow_next = {}               # 流场下一步 {goal_id: (rows, cols) int8，DIRECTIONS下标，-1为无}
+        self._flow_dirty = False          # 障碍物变化后，流场在下次使用前重建
         
+    
     def world_to_grid(self, x: float, y: float):
         return (int(y / self.cell_size), int(x / self.cell_size))
     
@@ -18,74 +40,85 @@ class Grid:
         return (col * self.cell_size + self.cell_size/2, 
                 row * self.cell_size + self.cell_size/2)
     
-    def add_wall(self, start, end):
-        # 使用Bresenham算法画线并标记为障碍
+    def cells_to_world(self, rows, cols):
+        """把网格坐标数组批量转换为世界坐标，返回形状为(N, 2)的数组"""
+        world = np.empty((len(rows), 2))
+        world[:, 0] = np.asarray(cols) * self.cell_size + self.cell_size / 2
+        world[:, 1] = np.asarray(rows) * self.cell_size + self.cell_size / 2
+        return world
+    
+    def _line_cells(self, start, end):
+        """线段经过的网格单元 (只保留网格内的)，返回 (rows, cols) 索引数组"""
         r0, c0 = self.world_to_grid(*start)
         r1, c1 = self.world_to_grid(*end)
-        dr = abs(r1 - r0)
-        dc = abs(c1 - c0)
-        sr = 1 if (r0 < r1) else -1
-        sc = 1 if (c0 < c1) else -1
-        err = dr - dc
-        r, c = r0, c0
-        while True:
-            if 0 <= r < self.rows and 0 <= c < self.cols:
-                self.grid[r, c] = True
-            if r == r1 and c == c1:
-                break
-            e2 = 2*err
-            if e2 > -dc:
-                err -= dc
-                r += sr
-            if e2 < dr:
-                err += dr
-                c += sc
+        n = max(abs(r1 - r0), abs(c1 - c0)) + 1
+        rs = np.round(np.linspace(r0, r1, n)).astype(np.intp)
+        cs = np.round(np.linspace(c0, c1, n)).astype(np.intp)
+        inside = (rs >= 0) & (rs < self.rows) & (cs >= 0) & (cs < self.cols)
+        return rs[inside], cs[inside]
+    
+    def add_wall(self, start, end):
+        # 把线段经过的单元一次性标记为障碍
+        rs, cs = self._line_cells(start, end)
+        self.grid[rs, cs] = True
+        self._obstacles_changed()
     
     def add_circle_obstacle(self, center, radius):
         center_row, center_col = self.world_to_grid(*center)
         radius_cells = int(radius / self.cell_size)
         
-        rows, cols = np.ogrid[:self.rows, :self.cols]
-        distances = np.sqrt((rows - center_row)**2 + (cols - center_col)**2)
-        mask = distances <= radius_cells
-
-        self.grid[mask] = True
-
+        # 只在圆的包围盒内比较距离平方 (不开方)；偏移量用int32，半径较大时平方也不会溢出
+        r0, r1 = max(0, center_row - radius_cells), min(self.rows, center_row + radius_cells + 1)
+        c0, c1 = max(0, center_col - radius_cells), min(self.cols, center_col + radius_cells + 1)
+        if r0 >= r1 or c0 >= c1:
+            return
+        dr = np.arange(r0 - center_row, r1 - center_row, dtype=np.int32)[:, None]
+        dc = np.arange(c0 - center_col, c1 - center_col, dtype=np.int32)[None, :]
+        mask = dr * dr + dc * dc <= radius_cells * radius_cells
 
-        # for r in range(max(0, center_row - radius_cells), 
-        #                min(self.rows, center_row + radius_cells + 1)):
-        #     for c in range(max(0, center_col - radius_cells), 
-        #                    min(self.cols, center_col + radius_cells + 1)):
-        #         if (r - center_row)**2 + (c - center_col)**2 <= radius_cells**2:
-        #             if 0 <= r < self.rows and 0 <= c < self.cols:
-        #                 self.grid[r, c] = True
+        self.grid[r0:r1, c0:c1] |= mask
+        self._obstacles_changed()
     
     def add_door(self, start, end):
-        # 使用Bresenham算法标记门所在线段为可通行（False），同时存储门坐标
-        r0, c0 = self.world_to_grid(*start)
-        r1, c1 = self.world_to_grid(*end)
-        dr = abs(r1 - r0)
-        dc = abs(c1 - c0)
-        sr = 1 if (r0 < r1) else -1
-        sc = 1 if (c0 < c1) else -1
-        err = dr - dc
-        r, c = r0, c0
-        door_cells = []
-        while True:
-            if 0 <= r < self.rows and 0 <= c < self.cols:
-                # 门所在位置应为可通行
-                self.grid[r, c] = False
-                door_cells.append((r, c))
-            if r == r1 and c == c1:
-                break
-            e2 = 2*err
-            if e2 > -dc:
-                err -= dc
-                r += sr
-            if e2 < dr:
-                err += dr
-                c += sc
-        self.doors.append((door_cells[0], door_cells[-1]))
+        # 把门所在线段标记为可通行（False），同时存储门两端的单元坐标
+        rs, cs = self._line_cells(start, end)
+        self.grid[rs, cs] = False
+        self.doors.append(((int(rs[0]), int(cs[0])), (int(rs[-1]), int(cs[-1]))))
+        self._obstacles_changed()
+    
+    def _obstacles_changed(self):
+        # 流场在下次使用前重建
+        self._flow_dirty = True
+    
+    def build_flow_field(self, goal_id, goals):
+        """
+        以goals(世界坐标列表)为源做一次多源Dijkstra，保存距离场和每个单元的下一步方向，
+        所有前往同一组目标的Agent共享。障碍物变化后会在下次trace_flow_field时自动重建。
+        """
+        self.flow_goals[goal_id] = list(goals)
+        if self._flow_dirty:
+            # 障碍物变化后已有的流场也都过期了，一并重建
+            self._rebuild_flow_fields()
+        else:
+            self._compute_flow_field(goal_id)
+    
+    def _compute_flow_field(self, goal_id):
+        dist = _flowfield_kernel(self.grid, _source_cells(self, self.flow_goals[goal_id]))
+        self.flow_dist[goal_id] = dist
+        self.flow_next[goal_id] = _flow_next_kernel(dist)
+    
+    def _rebuild_flow_fields(self):
+        self._flow_dirty = False
+        for goal_id in self.flow_goals:
+            self._compute_flow_field(goal_id)
+    
+    def trace_flow_field(self, goal_id, start):
+        """沿goal_id对应的流场从start走到最近的目标，返回世界坐标路径(N, 2)；不可达时返回空数组"""
+        if self._flow_dirty:
+            self._rebuild_flow_fields()
+        sr, sc = self.world_to_grid(*start)
+        cells = _trace_flow_kernel(self.flow_dist[goal_id], self.flow_next[goal_id], sr, sc)
+        return self.cells_to_world(cells // self.cols, cells % self.cols)
     
     def is_door(self, pos):
         # 可根据需要使用，但当前简化不强制走门才可跨障碍
@@ -96,85 +129,322 @@ class Grid:
                 return True
         return False
 
-def heuristic(a, b):
-    return abs(a[0]-b[0]) + abs(a[1]-b[1])
-
-def get_neighbors(pos, grid: Grid):
-    neighbors = []
-    directions = [(0,1),(1,0),(0,-1),(-1,0),(1,1),(1,-1),(-1,1),(-1,-1)]
-    for dr, dc in directions:
-        nr, nc = pos[0]+dr, pos[1]+dc
-        if 0 <= nr < grid.rows and 0 <= nc < grid.cols:
-            # 如果下一个格子是障碍就跳过
-            if grid.grid[nr, nc]:
-                continue
-            neighbors.append((nr, nc))
-    return neighbors
-
 def a_star(start, goal, grid: Grid):
-    start_grid = grid.world_to_grid(*start)
-    goal_grid = grid.world_to_grid(*goal)
+    """
+    A*寻路，返回世界坐标路径，形状为(N, 2)；无路径时返回空数组。
+    疏散模拟中的Agent沿流场 (Grid.trace_flow_field) 移动，不调用这里，
+    a_star保留作单次点到点寻路的接口。
+    """
+    if HAVE_NUMBA:
+        sr, sc = grid.world_to_grid(*start)
+        gr, gc = grid.world_to_grid(*goal)
+        cells = _a_star_kernel(grid.padded, sr, sc, gr, gc)
+        stride = grid.cols + 2
+        return grid.cells_to_world(cells // stride - 1, cells % stride - 1)
+    return _a_star_python(start, goal, grid)
+
+def _octile(dr, dc):
+    """整数步长下的octile启发距离"""
+    return STRAIGHT_STEP * (dr + dc) + (DIAGONAL_STEP - 2 * STRAIGHT_STEP) * min(dr, dc)
+
+def _a_star_python(start, goal, grid: Grid):
+    """
+    纯Python的A* (整数步长10/14、octile启发)，与_a_star_kernel结果一致。
+    在带哨兵边框的网格上搜索，节点编号为 (row+1)*(cols+2)+(col+1)，邻居不必检查越界；
+    障碍网格转换为扁平列表 (逐元素访问比ndarray快)，代价和父节点存放在以节点编号为键的字典中。
+    f值为整数且出队的f值单调不减，优先队列用桶队列 (Dial)：buckets[f - f0] 是后进先出的列表，
+    入队、出队都是O(1)。
+    """
+    rows, cols = grid.rows, grid.cols
+    sr, sc = grid.world_to_grid(*start)
+    gr, gc = grid.world_to_grid(*goal)
+    if not (0 <= sr < rows and 0 <= sc < cols and 0 <= gr < rows and 0 <= gc < cols):
+        return np.empty((0, 2))
     
-    frontier = PriorityQueue()
-    frontier.put((0, start_grid))
-    came_from = {start_grid: None}
-    cost_so_far = {start_grid: 0}
+    stride = cols + 2
+    blocked = grid.flat_grid.tolist()
+    # 以下行列号都是带边框网格中的坐标
+    sr += 1
+    sc += 1
+    gr += 1
+    gc += 1
+    start = sr * stride + sc
+    goal = gr * stride + gc
+    cost = {start: 0}
+    parent = {start: start}
+    moves = [(dr, dc, dr * stride + dc, step) for (dr, dc), step in zip(DIRECTIONS, DIRECTION_STEPS)]
     
-    while not frontier.empty():
-        current = frontier.get()[1]
+    f0 = _octile(abs(gr - sr), abs(gc - sc))
+    buckets = [[start]]
+    b = 0
+    while b < len(buckets):
+        bucket = buckets[b]
+        if not bucket:
+            b += 1
+            continue
+        current = bucket.pop()
+        r, c = divmod(current, stride)
+        current_cost = cost[current]
+        # 节点入队后代价又被改小时，旧的队列项已过期
+        if current_cost + _octile(abs(gr - r), abs(gc - c)) != f0 + b:
+            continue
         
-        if current == goal_grid:
+        if current == goal:
             break
         
-        for next_pos in get_neighbors(current, grid):
-            new_cost = cost_so_far[current] + 1
-            if next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]:
-                cost_so_far[next_pos] = new_cost
-                priority = new_cost + heuristic(goal_grid, next_pos)
-                frontier.put((priority, next_pos))
-                came_from[next_pos] = current
-    
-    if goal_grid not in came_from:
+        for dr, dc, offset, step in moves:
+            nxt = current + offset
+            if blocked[nxt]:
+                continue
+            new_cost = current_cost + step
+            if nxt not in cost or new_cost < cost[nxt]:
+                cost[nxt] = new_cost
+                k = new_cost + _octile(abs(gr - r - dr), abs(gc - c - dc)) - f0
+                while k >= len(buckets):
+                    buckets.append([])
+                buckets[k].append(nxt)
+                parent[nxt] = current
+    
+    if goal not in cost:
         # 无路径
-        return []
-    
-    path = []
-    cur = goal_grid
-    while cur is not None:
-        path.append(grid.grid_to_world(*cur))
-        cur = came_from[cur]
-    return list(reversed(path))
-
-# def a_star(start, goal, grid: Grid):
-#     start_grid = grid.world_to_grid(*start)
-#     goal_grid = grid.world_to_grid(*goal)
-#
-#     frontier = PriorityQueue()
-#     frontier.put((0, start_grid))
-#     came_from = {start_grid: None}
-#     cost_so_far = {start_grid: 0}
-#
-#     while not frontier.empty():
-#         _, current = frontier.get()
-#
-#         if current == goal_grid:
-#             break
-#
-#         neighbors = get_neighbors(current, grid)
-#         for next_pos in neighbors:
-#             new_cost = cost_so_far[current] + 1
-#             if next_pos not in cost_so_far or new_cost < cost_so_far[next_pos]:
-#                 cost_so_far[next_pos] = new_cost
-#                 priority = new_cost + heuristic(goal_grid, next_pos)
-#                 frontier.put((priority, next_pos))
-#                 came_from[next_pos] = current
-#
-#     if goal_grid not in came_from:
-#         return []
-#
-#     path = []
-#     cur = goal_grid
-#     while cur is not None:
-#         path.append(grid.grid_to_world(*cur))
-#         cur = came_from[cur]
-#     return list(reversed(path))
\ No newline at end of file
+        return np.empty((0, 2))
+    
+    cells = [goal]
+    while cells[-1] != start:
+        cells.append(parent[cells[-1]])
+    
+    # 一次性把节点编号转换为世界坐标 (x, y)
+    cells = np.array(cells[::-1])
+    return grid.cells_to_world(cells // stride - 1, cells % stride - 1)
+
+@njit(cache=True)
+def _heap_push(heap_f, heap_i, size, f, i):
+    """二叉堆插入，按 (f, i) 字典序排列 (与PriorityQueue中元组的比较一致)"""
+    if size == heap_f.shape[0]:
+        new_f = np.empty(size * 2, dtype=heap_f.dtype)
+        new_i = np.empty(size * 2, dtype=heap_i.dtype)
+        new_f[:size] = heap_f
+        new_i[:size] = heap_i
+        heap_f, heap_i = new_f, new_i
+    k = size
+    while k > 0:
+        p = (k - 1) // 2
+        if heap_f[p] < f or (heap_f[p] == f and heap_i[p] <= i):
+            break
+        heap_f[k] = heap_f[p]
+        heap_i[k] = heap_i[p]
+        k = p
+    heap_f[k] = f
+    heap_i[k] = i
+    return heap_f, heap_i, size + 1
+
+@njit(cache=True)
+def _heap_pop(heap_f, heap_i, size):
+    """弹出堆顶 (f, i)"""
+    f = heap_f[0]
+    i = heap_i[0]
+    size -= 1
+    last_f = heap_f[size]
+    last_i = heap_i[size]
+    k = 0
+    while True:
+        c = 2 * k + 1
+        if c >= size:
+            break
+        if c + 1 < size and (heap_f[c + 1] < heap_f[c] or
+                             (heap_f[c + 1] == heap_f[c] and heap_i[c + 1] < heap_i[c])):
+            c += 1
+        if last_f < heap_f[c] or (last_f == heap_f[c] and last_i <= heap_i[c]):
+            break
+        heap_f[k] = heap_f[c]
+        heap_i[k] = heap_i[c]
+        k = c
+    heap_f[k] = last_f
+    heap_i[k] = last_i
+    return f, i, size
+
+@njit(cache=True)
+def _bucket_push(head, entry_node, entry_next, size, k, node):
+    """把node放入第k个桶 (每个桶是后进先出的单链表，与_a_star_python中的列表顺序一致)"""
+    if k >= head.shape[0]:
+        new_head = np.full(max(2 * head.shape[0], k + 1), -1, dtype=np.int64)
+        new_head[:head.shape[0]] = head
+        head = new_head
+    if size == entry_node.shape[0]:
+        new_node = np.empty(size * 2, dtype=np.int64)
+        new_next = np.empty(size * 2, dtype=np.int64)
+        new_node[:size] = entry_node
+        new_next[:size] = entry_next
+        entry_node, entry_next = new_node, new_next
+    entry_node[size] = node
+    entry_next[size] = head[k]
+    head[k] = size
+    return head, entry_node, entry_next, size + 1
+
+@njit(cache=True)
+def _a_star_kernel(blocked, sr, sc, gr, gc):
+    """
+    与_a_star_python相同的A*搜索 (整数步长10/14、octile启发、桶队列)。
+    blocked为带哨兵边框的障碍网格 (Grid.padded)，sr, sc, gr, gc为网格内部的行列号；
+    返回路径上的节点编号 (起点到终点，编号为带边框网格中的 row*cols+col)，无路径时返回空数组。
+    """
+    rows, cols = blocked.shape
+    if not (0 <= sr < rows - 2 and 0 <= sc < cols - 2 and 0 <= gr < rows - 2 and 0 <= gc < cols - 2):
+        return np.empty(0, dtype=np.int64)
+
+    flat = blocked.ravel()
+    cost = np.full(flat.size, -1, dtype=np.int64)    # -1表示尚未到达
+    parent = np.empty(flat.size, dtype=np.int64)
+    sr += 1
+    sc += 1
+    gr += 1
+    gc += 1
+    start = sr * cols + sc
+    goal = gr * cols + gc
+    cost[start] = 0
+    parent[start] = start
+
+    dr0 = abs(gr - sr)
+    dc0 = abs(gc - sc)
+    f0 = STRAIGHT_STEP * (dr0 + dc0) + (DIAGONAL_STEP - 2 * STRAIGHT_STEP) * min(dr0, dc0)
+    head = np.full(64, -1, dtype=np.int64)
+    entry_node = np.empty(256, dtype=np.int64)
+    entry_next = np.empty(256, dtype=np.int64)
+    head, entry_node, entry_next, size = _bucket_push(head, entry_node, entry_next, 0, 0, start)
+    n_buckets = 1
+    b = 0
+    while b < n_buckets:
+        e = head[b]
+        if e < 0:
+            b += 1
+            continue
+        head[b] = entry_next[e]
+        current = entry_node[e]
+        r = current // cols
+        c = current % cols
+        hr = abs(gr - r)
+        hc = abs(gc - c)
+        if cost[current] + STRAIGHT_STEP * (hr + hc) + (DIAGONAL_STEP - 2 * STRAIGHT_STEP) * min(hr, hc) != f0 + b:
+            continue
+        if current == goal:
+            break
+        for k in range(8):
+            nr = r + DIRECTIONS[k][0]
+            nc = c + DIRECTIONS[k][1]
+            nxt = nr * cols + nc
+            # 边框是障碍单元，不需要越界检查
+            if flat[nxt]:
+                continue
+            new_cost = cost[current] + DIRECTION_STEPS[k]
+            if cost[nxt] < 0 or new_cost < cost[nxt]:
+                cost[nxt] = new_cost
+                hr = abs(gr - nr)
+                hc = abs(gc - nc)
+                bucket = new_cost + STRAIGHT_STEP * (hr + hc) + (DIAGONAL_STEP - 2 * STRAIGHT_STEP) * min(hr, hc) - f0
+                head, entry_node, entry_next, size = _bucket_push(head, entry_node, entry_next, size, bucket, nxt)
+                n_buckets = max(n_buckets, bucket + 1)
+                parent[nxt] = current
+
+    if cost[goal] < 0:
+        return np.empty(0, dtype=np.int64)
+
+    length = 1
+    cur = goal
+    while cur != start:
+        cur = parent[cur]
+        length += 1
+    path = np.empty(length, dtype=np.int64)
+    cur = goal
+    for k in range(length - 1, -1, -1):
+        path[k] = cur
+        cur = parent[cur]
+    return path
+
+@njit(cache=True)
+def _flowfield_kernel(blocked, sources):
+    """多源Dijkstra：从所有源节点向外扩展，直线步长1、对角步长sqrt(2)"""
+    rows, cols = blocked.shape
+    dist = np.full(rows * cols, np.inf)
+    heap_f = np.empty(256, dtype=np.float64)
+    heap_i = np.empty(256, dtype=np.int64)
+    size = 0
+    for s in sources:
+        dist[s] = 0.0
+        heap_f, heap_i, size = _heap_push(heap_f, heap_i, size, 0.0, s)
+
+    while size > 0:
+        d, current, size = _heap_pop(heap_f, heap_i, size)
+        if d > dist[current]:
+            continue
+        r = current // cols
+        c = current % cols
+        for k in range(8):
+            dr = DIRECTIONS[k][0]
+            dc = DIRECTIONS[k][1]
+            nr = r + dr
+            nc = c + dc
+            if nr < 0 or nr >= rows or nc < 0 or nc >= cols or blocked[nr, nc]:
+                continue
+            nxt = nr * cols + nc
+            step = DIRECTION_COSTS[k]
+            if d + step < dist[nxt]:
+                dist[nxt] = d + step
+                heap_f, heap_i, size = _heap_push(heap_f, heap_i, size, d + step, nxt)
+
+    return dist.reshape(rows, cols).astype(np.float32)
+
+@njit(cache=True)
+def _flow_next_kernel(dist):
+    """
+    每个单元指向距离最小且比自身更近的相邻单元，值为DIRECTIONS下标；没有更近的相邻单元时为-1。
+    障碍单元(距离为inf)也会指向可达的相邻单元，使落在障碍上的起点能走出来。
+    """
+    rows, cols = dist.shape
+    flow_next = np.full((rows, cols), -1, dtype=np.int8)
+    for r in range(rows):
+        for c in range(cols):
+            best = dist[r, c]
+            for k in range(8):
+                nr = r + DIRECTIONS[k][0]
+                nc = c + DIRECTIONS[k][1]
+                if nr < 0 or nr >= rows or nc < 0 or nc >= cols:
+                    continue
+                if dist[nr, nc] < best:
+                    best = dist[nr, nc]
+                    flow_next[r, c] = k
+    return flow_next
+
+def _source_cells(grid: Grid, sources):
+    """把目标点(世界坐标)转换为网格内的节点编号数组"""
+    cells = []
+    for pos in sources:
+        r, c = grid.world_to_grid(*pos)
+        if 0 <= r < grid.rows and 0 <= c < grid.cols:
+            cells.append(r * grid.cols + c)
+    return np.array(cells, dtype=np.int64)
+
+@njit(cache=True)
+def _trace_flow_kernel(dist, flow_next, sr, sc):
+    """从起点沿flow_next走到源节点(距离为0)，返回节点编号；不可达时返回空数组"""
+    rows, cols = dist.shape
+    if not (0 <= sr < rows and 0 <= sc < cols):
+        return np.empty(0, dtype=np.int64)
+
+    path = np.empty(64, dtype=np.int64)
+    path[0] = sr * cols + sc
+    length = 1
+    r = sr
+    c = sc
+    while dist[r, c] != 0:
+        k = flow_next[r, c]
+        if k < 0:
+            return np.empty(0, dtype=np.int64)
+        r += DIRECTIONS[k][0]
+        c += DIRECTIONS[k][1]
+        if length == path.size:
+            grown = np.empty(2 * length, dtype=np.int64)
+            grown[:length] = path
+            path = grown
+        path[length] = r * cols + c
+        length += 1
+    return path[:length]
@@ -2,8 +2,14 @@
 
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.colors import ListedColormap
 import numpy as np
-from matplotlib.animation import FuncAnimation
+from matplotlib.animation import FuncAnimation, ArtistAnimation, FFMpegWriter
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from evacuation import TARGET_TYPE_CODES
+import evacuation_kernels
 
 def plot_building(building, show_grid=False):
     fig, ax = plt.subplots(1, 3, figsize=(30, 10))
@@ -16,37 +22,42 @@ def plot_building(building, show_grid=False):
     plot_staircase(ax[2], building.staircase)
     
     # 在一楼和二楼图中标记楼梯位置
+    # (每层的入口合并为一个artist，不需要查询已有的图例标签)
     for floor_num in [1, 2]:
         floor_idx = floor_num - 1
-        for stairs in building.stairs.values():
-            if floor_num in stairs.entries:
-                x, y = stairs.get_entry_position(floor_num)
-                ax[floor_idx].plot(x, y, 's', color='red', markersize=10, 
-                                 label='Stair Entry/Exit' if 'Stair Entry/Exit' not in ax[floor_idx].get_legend_handles_labels()[1] else None)
+        entries = [stairs.get_entry_position(floor_num) for stairs in building.stairs.values()
+                   if floor_num in stairs.entries]
+        if entries:
+            x, y = zip(*entries)
+            ax[floor_idx].plot(x, y, 's', color='red', markersize=10, linestyle='none',
+                               label='Stair Entry/Exit')
     
     plt.tight_layout()
     plt.show()
 
 def plot_floor(ax, floor, title, grid=None, show_grid=False):
+    # 同类几何体合并为一个集合绘制，每类只有一个artist
     # 绘制房间边界
-    for room in floor.rooms:
-        x, y = zip(*room)
-        ax.plot(x, y, 'b-', label='Wall' if 'Wall' not in ax.get_legend_handles_labels()[1] else None)
+    rooms = floor.room_arrays
+    if rooms:
+        ax.add_collection(LineCollection(rooms,
+                                         colors='b', label='Wall'))
     
     # 绘制门
-    for door in floor.doors:
-        x, y = zip(*door)
-        ax.plot(x, y, 'g-', linewidth=3, label='Door' if 'Door' not in ax.get_legend_handles_labels()[1] else None)
+    doors = floor.door_arrays
+    if doors:
+        ax.add_collection(LineCollection(doors,
+                                         colors='g', linewidths=3, label='Door'))
     
     # 绘制障碍物
-    for obs in floor.obstacles:
-        if obs["type"] == "circle":
-            x, y, r = obs["params"]
-            ax.add_patch(Circle((x, y), r, color='red', alpha=0.5,
-                              label='Obstacle' if 'Obstacle' not in ax.get_legend_handles_labels()[1] else None))
-        elif obs["type"] == "line":
-            x, y = zip(*obs["params"])
-            ax.plot(x, y, 'orange', linewidth=2, label='Obstacle Line' if 'Obstacle Line' not in ax.get_legend_handles_labels()[1] else None)
+    circles = [Circle(obs["params"][:2], obs["params"][2])
+               for obs in floor.obstacles if obs["type"] == "circle"]
+    lines = [np.asarray(obs["params"]) for obs in floor.obstacles if obs["type"] == "line"]
+    if circles:
+        ax.add_collection(PatchCollection(circles, facecolor='red', edgecolor='red', alpha=0.5,
+                                          label='Obstacle'))
+    if lines:
+        ax.add_collection(LineCollection(lines, colors='orange', linewidths=2, label='Obstacle Line'))
     
     # 绘制主出口（仅一楼）
     if floor.main_exit is not None:
@@ -72,10 +83,12 @@ def plot_staircase(ax, staircase):
     x, y = zip(*staircase["area"])
     ax.plot(x, y, 'gray', linewidth=2, label='Staircase Area')
     
+    seen_labels = set()
     for entry in staircase["entries"]:
         ex, ey = zip(*entry["position"])
-        ax.plot(ex, ey, 'purple', linewidth=3, 
-                label=f'Stair Entry ({entry["floor"]}F)' if f'Stair Entry ({entry["floor"]}F)' not in ax.get_legend_handles_labels()[1] else None)
+        label = f'Stair Entry ({entry["floor"]}F)'
+        ax.plot(ex, ey, 'purple', linewidth=3, label=None if label in seen_labels else label)
+        seen_labels.add(label)
     
     ax.set_title("Staircase Layout")
     ax.set_xlim(20, 40)
@@ -83,105 +96,239 @@ def plot_staircase(ax, staircase):
     ax.set_aspect('equal')
     ax.legend()
 
-def plot_simulation(building, simulation):
-    fig, ax = plt.subplots(1, 3, figsize=(30, 10))
+# 动画帧间隔 (毫秒)
+FRAME_INTERVAL = 50
+
+def plot_simulation(building, simulation, draw_every=1, save_path=None):
+    """
+    动画显示疏散过程。每一帧推进draw_every个模拟步再绘制一次，
+    绘图耗时占主导时可增大draw_every加快动画 (模拟步长不变)。
+    给出save_path时不打开窗口，在独立的Agg画布上离线渲染到文件直到疏散完成
+    (.mp4用ffmpeg编码，其他格式由matplotlib按扩展名选择writer)，不改变pyplot的后端。
+    """
+    fig, ax = _simulation_figure(building, simulation, offscreen=save_path is not None)
+    
+    # 动态artist只创建一次，每帧只更新数据
+    artists = _create_frame_artists(ax)
+    
+    def init():
+        return list(artists.values())
     
     def update(frame):
-        ax[0].clear()
-        ax[1].clear()
-        ax[2].clear()
-        
-        # 绘制一楼和二楼（添加网格显示）
-        plot_floor(ax[0], building.floors[1], "1F Layout", 
-                  grid=simulation.grids[1], show_grid=False)
-        plot_floor(ax[1], building.floors[2], "2F Layout", 
-                  grid=simulation.grids[2], show_grid=False)
+        _show_state(artists, capture_state(simulation))
         
-        # 绘制楼梯区域
-        plot_staircase(ax[2], building.staircase)
-        
-        # 先绘制所有agent的路径
-        for agent in simulation.agents:
-            if not agent.in_stairs:
-                floor_idx = agent.floor - 1  # 确保在正确的楼层显示
-                if agent.path:
-                    path_points = [agent.position]
-                    if agent.target is not None:
-                        path_points.append(agent.target)
-                    path_points.extend(agent.path)
-                    path_points = np.array(path_points)
-                    ax[floor_idx].plot(path_points[:, 0], path_points[:, 1], 
-                                     '--', color='lightgray', alpha=0.5, linewidth=1)
-        
-        # 分别绘制在楼层中和在楼梯中的agent
-        for agent in simulation.agents:
-            if agent.in_stairs:
-                # 在楼梯中的agent
-                progress_ratio = 1.0 - (agent.stairs_progress / 3.0)
-                pos = agent.stair_start_pos * (1 - progress_ratio) + agent.stair_end_pos * progress_ratio
-                ax[2].plot(pos[0], pos[1], color='red', marker='o', markersize=5)
-            else:
-                # 在楼层中的agent
-                floor_idx = agent.floor - 1
-                color = 'yellow' if agent.target_type == 'stairs' else 'blue'
-                ax[floor_idx].plot(agent.position[0], agent.position[1], 
-                                 color=color, marker='o', markersize=5)
-        
-        # 更新模拟和统计信息
-        if not simulation.is_evacuation_complete():
+        # 推进模拟
+        for _ in range(draw_every):
+            if simulation.is_evacuation_complete():
+                break
             simulation.update()
         
-        stats = simulation.get_statistics()
-        ax[0].set_title(f"Time: {stats['current_time']:.1f}s | "
-                       f"Evacuated: {stats['evacuated_count']} | "
-                       f"Remaining: {stats['remaining_count']}")
-        ax[1].set_title(f"Avg Evacuation Time: {stats['average_evacuation_time']:.1f}s | "
-                       f"Max Time: {stats['max_evacuation_time']:.1f}s")
-        ax[2].set_title("Staircase Status")
-        
-        # 设置各子图的显示范围
-        ax[0].set_xlim(0, building.floors[1].width)
-        ax[0].set_ylim(0, building.floors[1].length)
-        ax[1].set_xlim(0, building.floors[2].width)
-        ax[1].set_ylim(0, building.floors[2].length)
-        ax[2].set_xlim(20, 40)
-        ax[2].set_ylim(30, 45)
-        
-        # 设置纵横比
-        ax[0].set_aspect('equal')
-        ax[1].set_aspect('equal')
-        ax[2].set_aspect('equal')
-        
-        return ax
+        return list(artists.values())
     
-    anim = FuncAnimation(fig, update, frames=None, interval=50, blit=False)
-    plt.tight_layout()
-    plt.show()
+    if save_path is None:
+        # 帧数不限，也不缓存帧数据 (缓存只在保存时有用，且会随帧数增长)
+        anim = FuncAnimation(fig, update, init_func=init, frames=None,
+                             interval=FRAME_INTERVAL, blit=True, cache_frame_data=False)
+        plt.show()
+        return
+    
+    # 离线保存：帧数由疏散过程决定，不缓存帧数据
+    anim = FuncAnimation(fig, update, init_func=init, frames=_frames_until_complete(simulation),
+                         interval=FRAME_INTERVAL, blit=True, cache_frame_data=False)
+    _save_animation(anim, save_path)
+
+def plot_simulation_offline(building, simulation, draw_every=1, save_path=None):
+    """
+    先把模拟运行到疏散完成并记录每帧的状态，再用ArtistAnimation播放，
+    播放时不再推进模拟，每帧的artist都预先创建好。参数含义同plot_simulation。
+    """
+    states = [capture_state(simulation)]
+    while not simulation.is_evacuation_complete():
+        for _ in range(draw_every):
+            if simulation.is_evacuation_complete():
+                break
+            simulation.update()
+        states.append(capture_state(simulation))
+    
+    fig, ax = _simulation_figure(building, simulation, offscreen=save_path is not None)
+    frames = []
+    for state in states:
+        artists = _create_frame_artists(ax)
+        _show_state(artists, state)
+        frames.append(list(artists.values()))
+    
+    anim = ArtistAnimation(fig, frames, interval=FRAME_INTERVAL, blit=True)
+    if save_path is None:
+        plt.show()
+        return
+    _save_animation(anim, save_path)
+
+def capture_state(simulation):
+    """
+    记录模拟当前需要绘制的状态 (都是新数组，之后推进模拟不会改变它们)：
+    每层的路径折线、前往出口/楼梯的Agent位置，楼梯中Agent的位置和统计信息。
+    """
+    # 一次分组得到每一类Agent的行号，不再逐个读取Agent属性
+    n = simulation.active_count
+    pos = simulation.pos[:n]
+    order, starts = _group_agents(simulation)
+    
+    state = {'paths': [], 'exit': [], 'stairs': []}
+    for i in range(2):
+        exit_rows = order[starts[2 * i + 1]:starts[2 * i + 2]]
+        stairs_rows = order[starts[2 * i + 2]:starts[2 * i + 3]]
+        state['paths'].append(_path_points(simulation, np.sort(np.concatenate([exit_rows, stairs_rows]))))
+        state['exit'].append(pos[exit_rows])
+        state['stairs'].append(pos[stairs_rows])
+    
+    # 在楼梯中的agent：在楼梯起点和终点之间按通行进度插值
+    in_stairs = order[starts[0]:starts[1]]
+    # 通行时间取自各Agent所在楼梯的Stairs.passing_time (楼梯中的人数不超过楼梯容量，逐个读取即可)
+    passing_time = np.array([simulation.agents[i].current_stairs.passing_time for i in in_stairs],
+                            dtype=np.float64)
+    if evacuation_kernels.HAVE_NUMBA:
+        state['in_stairs'] = evacuation_kernels.stair_positions(
+            simulation.stair_start, simulation.stair_end, simulation.stairs_progress,
+            in_stairs, passing_time)
+    else:
+        start = simulation.stair_start[in_stairs]
+        end = simulation.stair_end[in_stairs]
+        progress_ratio = 1.0 - simulation.stairs_progress[in_stairs, np.newaxis] / passing_time[:, np.newaxis]
+        state['in_stairs'] = start + progress_ratio * (end - start)
+    
+    state['stats'] = simulation.get_statistics()
+    return state
+
+def _group_agents(simulation):
+    """
+    按绘图类别分组Agent，返回 (order, starts)，类别含义见evacuation_kernels.group_agents。
+    没有numba时用稳定排序得到同样的结果。
+    """
+    n = simulation.active_count
+    floor = simulation.floor[:n]
+    in_stairs = simulation.in_stairs[:n]
+    target_type = simulation.target_type[:n]
+    n_groups = 2 * max(simulation.building.floors) + 1
+    if evacuation_kernels.HAVE_NUMBA:
+        return evacuation_kernels.group_agents(floor, in_stairs, target_type, n_groups)
+    to_stairs = target_type == TARGET_TYPE_CODES['stairs']
+    group = np.where(in_stairs, 0, 2 * floor.astype(np.int64) - 1 + to_stairs)
+    order = np.argsort(group, kind='stable')
+    starts = np.searchsorted(group[order], np.arange(n_groups + 1))
+    return order, starts
+
+def _simulation_figure(building, simulation, offscreen=False):
+    """
+    创建动画的画布并绘制静态背景：墙、门、障碍物、楼梯区域和图例在动画中不变。
+    offscreen为True时创建不受pyplot管理的Figure并挂上Agg画布，只用于保存文件。
+    """
+    if offscreen:
+        fig = Figure(figsize=(30, 10))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots(1, 3)
+    else:
+        fig, ax = plt.subplots(1, 3, figsize=(30, 10))
+    plot_floor(ax[0], building.floors[1], "1F Layout", 
+              grid=simulation.grids[1], show_grid=False)
+    plot_floor(ax[1], building.floors[2], "2F Layout", 
+              grid=simulation.grids[2], show_grid=False)
+    plot_staircase(ax[2], building.staircase)
+    ax[2].set_title("Staircase Status")
+    fig.tight_layout()
+    return fig, ax
+
+def _create_frame_artists(ax):
+    """
+    创建一帧的动态artist：每层一条路径线 (各Agent的路径之间用NaN断开)、
+    一组前往出口的Agent(蓝)、一组前往楼梯的Agent(黄)，楼梯中的Agent(红)和统计信息
+    """
+    artists = {}
+    for i in range(2):
+        artists[f'path{i}'] = ax[i].plot([], [], '--', color='lightgray', alpha=0.5, linewidth=1)[0]
+        artists[f'exit{i}'] = ax[i].plot([], [], 'o', color='blue', markersize=5)[0]
+        artists[f'stairs{i}'] = ax[i].plot([], [], 'o', color='yellow', markersize=5)[0]
+    artists['in_stairs'] = ax[2].plot([], [], 'o', color='red', markersize=5)[0]
+    
+    # 统计信息放在坐标轴内部：blit只重绘坐标轴区域，标题不会被刷新
+    text_style = dict(va='top', fontsize=10,
+                      bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+    artists['time'] = ax[0].text(0.02, 0.98, '', transform=ax[0].transAxes, **text_style)
+    artists['stats'] = ax[1].text(0.02, 0.98, '', transform=ax[1].transAxes, **text_style)
+    return artists
+
+def _show_state(artists, state):
+    """把capture_state记录的状态写入_create_frame_artists创建的artist"""
+    for i in range(2):
+        _set_points(artists[f'path{i}'], state['paths'][i])
+        _set_points(artists[f'exit{i}'], state['exit'][i])
+        _set_points(artists[f'stairs{i}'], state['stairs'][i])
+    _set_points(artists['in_stairs'], state['in_stairs'])
+    
+    stats = state['stats']
+    artists['time'].set_text(f"Time: {stats['current_time']:.1f}s | "
+                             f"Evacuated: {stats['evacuated_count']} | "
+                             f"Remaining: {stats['remaining_count']}")
+    artists['stats'].set_text(f"Avg Evacuation Time: {stats['average_evacuation_time']:.1f}s | "
+                              f"Max Time: {stats['max_evacuation_time']:.1f}s")
+
+def _save_animation(anim, save_path):
+    """保存动画，.mp4用ffmpeg编码"""
+    writer = None
+    if save_path.endswith('.mp4'):
+        writer = FFMpegWriter(fps=1000 // FRAME_INTERVAL, codec='h264', bitrate=2000)
+    anim.save(save_path, writer=writer)
+
+def _frames_until_complete(simulation):
+    """疏散完成前不断产生帧编号，完成后再多给一帧以绘制最终状态"""
+    frame = 0
+    while not simulation.is_evacuation_complete():
+        yield frame
+        frame += 1
+    yield frame
+
+def _path_points(simulation, rows):
+    """
+    把rows中各Agent的剩余路径拼成一条折线：当前位置、当前目标点、剩余路径点，
+    各Agent之间用NaN断开。没有剩余路径的Agent不绘制。
+    """
+    rows = rows[simulation.path_end[rows] > simulation.path_idx[rows]]
+    if len(rows) == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    lengths = simulation.path_end[rows] - simulation.path_idx[rows]
+    has_target = simulation.has_target[rows]
+    # 每个Agent占 位置 + 目标点(可选) + 剩余路径 + NaN 这么多行
+    counts = 2 + has_target + lengths
+    starts = np.cumsum(counts) - counts
+    points = np.full((int(counts.sum()), 2), np.nan, dtype=np.float32)
+    points[starts] = simulation.pos[rows]
+    points[(starts + 1)[has_target]] = simulation.target[rows[has_target]]
+    path_starts = starts + 1 + has_target
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    points[np.repeat(path_starts, lengths) + offsets] = \
+        simulation.path_buf[np.repeat(simulation.path_idx[rows], lengths) + offsets]
+    return points
+
+def _set_points(line, points):
+    """用点列表更新Line2D的数据"""
+    if len(points):
+        points = np.asarray(points)
+        line.set_data(points[:, 0], points[:, 1])
+    else:
+        line.set_data([], [])
+
+# 障碍物网格的颜色：可走为透明，障碍为半透明红色
+OBSTACLE_CMAP = ListedColormap([(0, 0, 0, 0), (1, 0, 0, 0.3)])
 
 def plot_grid(ax, grid, alpha=0.2):
     """绘制网格"""
-    # 绘制网格线
-    for i in range(grid.rows + 1):
-        y = i * grid.cell_size
-        ax.plot([0, grid.cols * grid.cell_size], [y, y], 
-                'gray', alpha=alpha, linewidth=0.5)
-    
-    for j in range(grid.cols + 1):
-        x = j * grid.cell_size
-        ax.plot([x, x], [0, grid.rows * grid.cell_size], 
-                'gray', alpha=alpha, linewidth=0.5)
-    
-    # 绘制障碍物网格
-    obstacle_mask = grid.grid
-    for i in range(grid.rows):
-        for j in range(grid.cols):
-            if obstacle_mask[i, j]:
-                x = j * grid.cell_size
-                y = i * grid.cell_size
-                ax.add_patch(plt.Rectangle(
-                    (x, y), 
-                    grid.cell_size, 
-                    grid.cell_size, 
-                    facecolor='red', 
-                    alpha=0.3
-                ))
\ No newline at end of file
+    width = grid.cols * grid.cell_size
+    length = grid.rows * grid.cell_size
+    
+    # 绘制网格线 (用次刻度的网格线，不为每条线单独创建artist)
+    ax.set_xticks(np.arange(0, width + grid.cell_size, grid.cell_size), minor=True)
+    ax.set_yticks(np.arange(0, length + grid.cell_size, grid.cell_size), minor=True)
+    ax.grid(which='minor', color='gray', alpha=alpha, linewidth=0.5)
+    
+    # 绘制障碍物网格 (整个布尔网格作为一张图像绘制)
+    ax.imshow(grid.grid, extent=[0, width, 0, length], origin='lower',
+              cmap=OBSTACLE_CMAP, vmin=0, vmax=1, interpolation='nearest')